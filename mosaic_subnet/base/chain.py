@@ -0,0 +1,120 @@
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from loguru import logger
+
+from communex.client import CommuneClient
+from communex.types import Ss58Address
+
+from .utils import get_ip_port, get_netuid
+
+
+@dataclass(frozen=True)
+class ChainState:
+    netuid: int
+    # uid -> [ip, port], already filtered by get_ip_port
+    addresses: dict[int, list[str]] = field(default_factory=dict)
+    keys: dict[int, Ss58Address] = field(default_factory=dict)
+    # uid -> sum of the weights every validator gives it
+    weights: dict[int, int] = field(default_factory=dict)
+    # keys of the modules that set weights
+    validator_keys: frozenset[Ss58Address] = frozenset()
+    modules_updated_at: float = 0.0
+    weights_updated_at: float = 0.0
+
+
+class ChainSnapshot:
+    """
+    Periodically refreshed view of the subnet state on chain.
+
+    Addresses and keys are refreshed every `modules_ttl` seconds and weights
+    every `weights_ttl` seconds by a background thread. Readers get the last
+    complete `ChainState` through `state` without ever touching the chain;
+    a failed refresh keeps the previous state.
+    """
+
+    def __init__(
+        self,
+        client: CommuneClient,
+        netuid: Optional[int] = None,
+        subnet_name: str = "mosaic",
+        modules_ttl: float = 60,
+        weights_ttl: float = 300,
+    ) -> None:
+        self.client = client
+        self.modules_ttl = modules_ttl
+        self.weights_ttl = weights_ttl
+        if netuid is None:
+            netuid = get_netuid(client, subnet_name)
+        self._state = ChainState(netuid=netuid)
+        self._voters: frozenset[int] = frozenset()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.refresh(force=True)
+
+    @property
+    def netuid(self) -> int:
+        return self._state.netuid
+
+    @property
+    def state(self) -> ChainState:
+        return self._state
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            state = self._state
+            now = time.time()
+            if force or now - state.modules_updated_at >= self.modules_ttl:
+                state = self._refresh_modules(state)
+            if force or now - state.weights_updated_at >= self.weights_ttl:
+                state = self._refresh_weights(state)
+            if state is not self._state:
+                state = replace(
+                    state,
+                    validator_keys=frozenset(
+                        state.keys[uid] for uid in self._voters if uid in state.keys
+                    ),
+                )
+            self._state = state
+
+    def _refresh_modules(self, state: ChainState) -> ChainState:
+        try:
+            addresses = self.client.query_map_address(state.netuid)
+            keys = self.client.query_map_key(state.netuid)
+        except Exception as e:
+            logger.error(f"failed to refresh modules: {e}")
+            return state
+        return replace(
+            state,
+            addresses=get_ip_port(addresses),
+            keys=keys,
+            modules_updated_at=time.time(),
+        )
+
+    def _refresh_weights(self, state: ChainState) -> ChainState:
+        try:
+            modules_weights = self.client.query_map_weights(netuid=state.netuid)
+        except Exception as e:
+            logger.error(f"failed to refresh weights: {e}")
+            return state
+        weights: dict[int, int] = {}
+        for _, weight_list in modules_weights.items():
+            for uid, score in weight_list:
+                weights[uid] = weights.get(uid, 0) + score
+        self._voters = frozenset(modules_weights)
+        return replace(state, weights=weights, weights_updated_at=time.time())
+
+    def refresh_loop(self):
+        interval = min(self.modules_ttl, self.weights_ttl) / 2
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        logger.info("start chain refresh loop")
+        self._thread = threading.Thread(target=self.refresh_loop, daemon=True)
+        self._thread.start()
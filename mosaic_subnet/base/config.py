@@ -1,10 +1,18 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class MosaicBaseSettings(BaseSettings):
     use_testnet: bool = False
     call_timeout: int = 60
+    # skips the subnet name lookup on startup when set
+    netuid: Optional[int] = None
+    # refresh intervals of the chain state snapshot
+    chain_modules_ttl: float = 60
+    chain_weights_ttl: float = 300
+    # keep-alive connections to miners
+    pool_limit_per_host: int = 8
+    pool_idle_timeout: float = 60
 
     # TODO: whitelist&blacklist
     # whitelist: List[str] = []
@@ -0,0 +1,87 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Generic, Optional, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+@contextmanager
+def log_duration(what: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(f"{what} took {time.perf_counter() - start:.2f}s")
+
+
+class Lazy(Generic[T]):
+    """
+    A value built by `factory` on first use, once, even when first used from
+    several threads at the same time.
+
+    When `factory` fails, `get` raises the same error again for
+    `retry_interval` seconds before calling `factory` again.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], T],
+        name: Optional[str] = None,
+        retry_interval: float = 0,
+    ) -> None:
+        self.factory = factory
+        self.name = name or getattr(factory, "__name__", "value")
+        self.retry_interval = retry_interval
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._error: Optional[Exception] = None
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                if (
+                    self._error is not None
+                    and time.monotonic() - self._failed_at < self.retry_interval
+                ):
+                    raise self._error
+                try:
+                    with log_duration(f"loading {self.name}"):
+                        self._value = self.factory()
+                except Exception as e:
+                    self._error, self._failed_at = e, time.monotonic()
+                    raise
+                self._loaded = True
+                self._error = None
+        return self._value
+
+    def set(self, value: T):
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+    def preload(self) -> threading.Thread:
+        """
+        Builds the value in a daemon thread; errors are logged and raised
+        again by the next `get`.
+        """
+
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                logger.error(f"failed to load {self.name}: {e}")
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+from loguru import logger
+
+from substrateinterface import Keypair
+from communex.module._signer import sign
+from communex.module.client import iso_timestamp_now, serialize
+from communex.types import Ss58Address
+
+from mosaic_subnet.base.metrics import counter, gauge
+
+# (ip, port, miner key)
+PoolKey = tuple[str, int, Ss58Address]
+MinerInfo = tuple[list[str], Ss58Address]
+
+POOL_SESSIONS = gauge("mosaic_pool_sessions", "Open keep-alive sessions to miners")
+POOL_EVICTIONS = counter("mosaic_pool_evictions_total", "Miner sessions closed by reason")
+
+
+class RequestSigner:
+    """
+    Signs module calls like `ModuleClient.call`, with the headers that only
+    depend on the key built once.
+    """
+
+    def __init__(self, key: Keypair) -> None:
+        self.key = key
+        self._headers = {
+            "Content-Type": "application/json",
+            "X-Key": key.public_key.hex(),
+            "X-Crypto": str(key.crypto_type),
+        }
+
+    def __call__(
+        self, target_key: Ss58Address, params: dict[str, Any]
+    ) -> tuple[bytes, dict[str, str]]:
+        timestamp = iso_timestamp_now()
+        request_data: dict[str, Any] = {"params": {**params, "target_key": target_key}}
+        body = serialize(request_data)
+        request_data["timestamp"] = timestamp
+        signature = sign(self.key, serialize(request_data))
+        return body, {
+            **self._headers,
+            "X-Signature": signature.hex(),
+            "X-Timestamp": timestamp,
+        }
+
+
+class MinerConnectionPool:
+    """
+    Keep-alive HTTP sessions to miners, one per (ip, port, miner key).
+
+    Each session keeps at most `limit_per_host` connections open. Sessions
+    unused for `idle_timeout` seconds are closed, as are sessions of uids
+    whose address changed in `update`. Sessions belong to the event loop
+    that created them; when the pool is used from a new loop, the old ones
+    are dropped.
+    """
+
+    def __init__(
+        self,
+        key: Keypair,
+        limit_per_host: int = 8,
+        idle_timeout: float = 60,
+    ) -> None:
+        self.signer = RequestSigner(key)
+        self.limit_per_host = limit_per_host
+        self.idle_timeout = idle_timeout
+        self._sessions: dict[PoolKey, aiohttp.ClientSession] = {}
+        self._last_used: dict[PoolKey, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_sweep = time.monotonic()
+        # written by `update`, which may run outside the event loop
+        self._addresses: dict[int, PoolKey] = {}
+        self._stale: set[PoolKey] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def pool_key(miner_info: MinerInfo) -> PoolKey:
+        (ip, port), miner_key = miner_info
+        return ip, int(port), miner_key
+
+    def update(self, modules_info: dict[int, MinerInfo]):
+        """
+        Records the current address of every uid and marks the sessions of
+        uids whose address or key changed for closing.
+        """
+        with self._lock:
+            for uid, miner_info in modules_info.items():
+                pool_key = self.pool_key(miner_info)
+                previous = self._addresses.get(uid)
+                if previous is not None and previous != pool_key:
+                    self._stale.add(previous)
+                self._addresses[uid] = pool_key
+
+    def _close(self, pool_key: PoolKey, reason: str):
+        session = self._sessions.pop(pool_key, None)
+        self._last_used.pop(pool_key, None)
+        if session is not None:
+            POOL_EVICTIONS.inc(reason=reason)
+            asyncio.get_running_loop().create_task(session.close())
+
+    def _sweep(self, now: float):
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        for pool_key in stale:
+            self._close(pool_key, "address_changed")
+        if now - self._last_sweep < self.idle_timeout / 2:
+            return
+        self._last_sweep = now
+        for pool_key, last_used in list(self._last_used.items()):
+            if now - last_used > self.idle_timeout:
+                self._close(pool_key, "idle")
+
+    def session(self, miner_info: MinerInfo) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._sessions:
+                logger.debug(f"dropping {len(self._sessions)} sessions of a previous loop")
+            self._sessions.clear()
+            self._last_used.clear()
+            self._loop = loop
+        now = time.monotonic()
+        self._sweep(now)
+        pool_key = self.pool_key(miner_info)
+        session = self._sessions.get(pool_key)
+        if session is None or session.closed:
+            session = self._sessions[pool_key] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit_per_host, keepalive_timeout=self.idle_timeout
+                )
+            )
+        self._last_used[pool_key] = now
+        POOL_SESSIONS.set(len(self._sessions))
+        return session
+
+    def _url(self, miner_info: MinerInfo, fn: str) -> str:
+        ip, port, _ = self.pool_key(miner_info)
+        return f"http://{ip}:{port}/method/{fn}"
+
+    async def call(
+        self,
+        miner_info: MinerInfo,
+        fn: str,
+        params: dict[str, Any],
+        timeout: float,
+    ) -> Any:
+        """
+        Calls a module endpoint and returns its JSON result, raising on any
+        other answer, like `ModuleClient.call`.
+        """
+        body, headers = self.signer(miner_info[1], params)
+        async with self.session(miner_info).post(
+            self._url(miner_info, fn),
+            data=body,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            if response.status != 200:
+                raise Exception(
+                    f"Unexpected status code: {response.status}, "
+                    f"response: {await response.text()}"
+                )
+            if response.content_type != "application/json":
+                raise Exception(f"Unknown content type: {response.content_type}")
+            return await response.json()
+
+    async def stream(
+        self,
+        miner_info: MinerInfo,
+        fn: str,
+        params: dict[str, Any],
+        timeout: float,
+    ) -> AsyncIterator[dict]:
+        """
+        Calls a module route that answers with newline-delimited JSON and
+        yields its messages.
+        """
+        body, headers = self.signer(miner_info[1], params)
+        async with self.session(miner_info).post(
+            self._url(miner_info, fn),
+            data=body,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            if response.status != 200:
+                raise Exception(
+                    f"Unexpected status code: {response.status}, "
+                    f"response: {await response.text()}"
+                )
+            # final images are far longer than aiohttp's readline limit
+            buffer = b""
+            async for chunk in response.content.iter_any():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+            if buffer.strip():
+                yield json.loads(buffer)
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._last_used.clear()
+        POOL_SESSIONS.set(0)
+        await asyncio.gather(*(session.close() for session in sessions))
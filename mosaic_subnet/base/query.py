@@ -0,0 +1,178 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Optional
+
+from loguru import logger
+
+from substrateinterface import Keypair
+from communex.module.client import ModuleClient
+
+from mosaic_subnet.base.image_codec import from_transport
+from mosaic_subnet.base.pool import MinerConnectionPool, MinerInfo
+
+if TYPE_CHECKING:
+    from mosaic_subnet.base import SampleInput
+
+
+async def call_miner(
+    key: Keypair,
+    miner_info: MinerInfo,
+    input: "SampleInput",
+    timeout: float,
+    pool: Optional[MinerConnectionPool] = None,
+) -> Optional[bytes]:
+    """
+    Calls the `sample` endpoint of a single miner and returns the decoded image,
+    or None if the miner failed or didn't answer in time. Calls go through
+    the keep-alive sessions of `pool` when given.
+    """
+    try:
+        connection, miner_key = miner_info
+        module_ip, module_port = connection
+        logger.debug("call", module_ip, module_port)
+        params = input.model_dump(mode="json")
+        if pool is not None:
+            result = await pool.call(miner_info, "sample", params, timeout)
+        else:
+            client = ModuleClient(host=module_ip, port=int(module_port), key=key)
+            result = await client.call(
+                fn="sample", target_key=miner_key, params=params, timeout=timeout
+            )
+        return from_transport(result)
+    except Exception as e:
+        logger.error(e)
+        return None
+
+
+async def stream_miner(
+    key: Keypair,
+    miner_info: MinerInfo,
+    input: "SampleInput",
+    timeout: float,
+    preview_every: int = 4,
+    pool: Optional[MinerConnectionPool] = None,
+) -> AsyncIterator[dict]:
+    """
+    Calls the `sample_stream` route of a single miner and yields its events,
+    see `DiffUsers.sample_stream`. Raises on connection errors and non-200
+    answers, before anything is yielded.
+    """
+    params = {**input.model_dump(mode="json"), "preview_every": preview_every}
+    if pool is not None:
+        async for event in pool.stream(miner_info, "sample_stream", params, timeout):
+            yield event
+        return
+    pool = MinerConnectionPool(key)
+    try:
+        async for event in pool.stream(miner_info, "sample_stream", params, timeout):
+            yield event
+    finally:
+        await pool.close()
+
+
+class MinerQueryEngine:
+    """
+    Queries many miners concurrently on a single event loop.
+
+    The number of in-flight calls is capped by `max_concurrency`, across all
+    the rounds and prompts being queried at the same time, and the whole
+    round shares one deadline, so a round costs roughly one `call_timeout`
+    no matter how many miners are queried. Connections to miners are kept
+    alive between rounds by `pool`.
+    """
+
+    def __init__(
+        self,
+        key: Keypair,
+        call_timeout: float = 60,
+        max_concurrency: int = 64,
+        round_timeout: Optional[float] = None,
+        pool: Optional[MinerConnectionPool] = None,
+    ) -> None:
+        self.key = key
+        self.call_timeout = call_timeout
+        self.max_concurrency = max_concurrency
+        self.round_timeout = round_timeout or call_timeout
+        self.pool = pool or MinerConnectionPool(key)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def semaphore(self) -> asyncio.Semaphore:
+        # shared by every `stream` on the running loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._semaphore_loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _query(
+        self,
+        semaphore: asyncio.Semaphore,
+        deadline: float,
+        uid: int,
+        miner_info: MinerInfo,
+        input: "SampleInput",
+    ) -> tuple[int, Optional[bytes]]:
+        async with semaphore:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return uid, None
+            timeout = min(self.call_timeout, remaining)
+            return uid, await call_miner(
+                self.key, miner_info, input, timeout, pool=self.pool
+            )
+
+    async def stream(
+        self,
+        modules_info: dict[int, MinerInfo],
+        input: "SampleInput",
+    ) -> AsyncIterator[tuple[int, Optional[bytes]]]:
+        """
+        Yields `(uid, image)` pairs in completion order. Miners that are still
+        pending when the round deadline passes are cancelled and yielded with
+        a None image. Calls run as tasks, so answers that arrive while the
+        consumer is busy with a previous pair are kept, not timed out.
+        """
+        if not modules_info:
+            return
+        self.pool.update(modules_info)
+        semaphore = self.semaphore()
+        deadline = time.monotonic() + self.round_timeout
+        tasks = {
+            asyncio.create_task(
+                self._query(semaphore, deadline, uid, miner_info, input)
+            ): uid
+            for uid, miner_info in modules_info.items()
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+            if pending:
+                answered = [task for task in pending if task.done()]
+                pending = {task for task in pending if not task.done()}
+                if pending:
+                    logger.info(f"round deadline reached, {len(pending)} miners timed out")
+                for task in pending:
+                    task.cancel()
+                for task in answered:
+                    yield task.result()
+                for task in pending:
+                    yield tasks[task], None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def gather(
+        self,
+        modules_info: dict[int, MinerInfo],
+        input: "SampleInput",
+    ) -> dict[int, Optional[bytes]]:
+        return {uid: result async for uid, result in self.stream(modules_info, input)}
@@ -0,0 +1,209 @@
+"""
+Local end-to-end benchmarks: stub miners on localhost, a fake chain client,
+and the real validator and gateway code paths on top of them.
+"""
+import asyncio
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from loguru import logger
+
+from communex.key import generate_keypair
+
+from mosaic_subnet.bench.fake_chain import FakeCommuneClient
+from mosaic_subnet.bench.stub_miner import StubMinerConfig, StubMinerFleet
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def q(p: float) -> float:
+        return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": q(0.50),
+        "p95": q(0.95),
+        "p99": q(0.99),
+        "max": samples[-1],
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes on linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class StubScorer:
+    """
+    Replaces CLIP to measure everything but the model.
+    """
+
+    model_name = "stub"
+
+    def encode_text(self, prompt: str):
+        return None
+
+    def score_images(
+        self, text_embeds, files: list[bytes], batch_size=None, nsfw=None
+    ) -> list[float]:
+        return [random.uniform(0.2, 0.35) for _ in files]
+
+
+def write_prompts(directory: str, count: int = 1000) -> str:
+    path = os.path.join(directory, "prompts.txt")
+    subjects = ["cat", "mountain", "city at night", "robot", "forest", "portrait"]
+    styles = ["oil painting", "photo", "watercolor", "3d render", "pixel art"]
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(f"{random.choice(subjects)}, {random.choice(styles)}, {i}\n")
+    return path
+
+
+def bench_validator(
+    miners: int = 50,
+    rounds: int = 5,
+    config: StubMinerConfig | None = None,
+    scorer: str = "clip",
+    call_timeout: int = 10,
+    query_concurrency: int = 64,
+    rpc_latency: float = 0.0,
+) -> dict:
+    from mosaic_subnet.validator import Validator, ValidatorSettings
+
+    config = config or StubMinerConfig()
+    with StubMinerFleet(miners, config) as fleet, tempfile.TemporaryDirectory() as tmp:
+        key = generate_keypair()
+        client = FakeCommuneClient(key.ss58_address, fleet.miners, rpc_latency=rpc_latency)
+        settings = ValidatorSettings(
+            netuid=client.netuid,
+            call_timeout=call_timeout,
+            query_concurrency=query_concurrency,
+            prompt_source=write_prompts(tmp),
+            prompt_store_path=os.path.join(tmp, "prompts.bin"),
+            nsfw_screening=scorer != "stub",
+        )
+        validator = Validator(key=key, settings=settings, c_client=client)
+        if scorer == "stub":
+            validator.model = StubScorer()
+
+        durations: list[float] = []
+        stages: dict[str, list[float]] = defaultdict(list)
+
+        # one loop for all rounds, like `validation_loop`, so that miner
+        # connections are kept alive between rounds
+        async def run():
+            for i in range(rounds):
+                start = time.perf_counter()
+                await validator.validate_step()
+                durations.append(time.perf_counter() - start)
+                for stage, value in validator.round_timings.items():
+                    stages[stage].append(value)
+                logger.info(f"round {i} took {durations[-1]:.3f}s")
+            await validator.query_engine.pool.close()
+
+        asyncio.run(run())
+
+        return {
+            "miners": miners,
+            "rounds": rounds,
+            "rounds_per_sec": rounds / sum(durations),
+            "round": percentiles(durations),
+            "stages": {stage: percentiles(values) for stage, values in stages.items()},
+            "votes": len(client.votes),
+            "rpc_calls": client.rpc_calls,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def bench_gateway(
+    miners: int = 16,
+    requests: int = 200,
+    concurrency: int = 16,
+    config: StubMinerConfig | None = None,
+    seeded: bool = False,
+    call_timeout: int = 10,
+) -> dict:
+    import httpx
+
+    from mosaic_subnet.gateway import app, Gateway, GatewaySettings
+
+    config = config or StubMinerConfig()
+    with StubMinerFleet(miners, config) as fleet:
+        key = generate_keypair()
+        client = FakeCommuneClient(key.ss58_address, fleet.miners)
+        settings = GatewaySettings(
+            host="127.0.0.1",
+            port=0,
+            netuid=client.netuid,
+            call_timeout=call_timeout,
+            top_miners=miners,
+        )
+        app.m = Gateway(key=key, settings=settings, c_client=client)
+
+        latencies: list[float] = []
+        statuses: dict[int, int] = defaultdict(int)
+
+        async def run() -> float:
+            semaphore = asyncio.Semaphore(concurrency)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://gateway", timeout=None
+            ) as http:
+
+                async def generate(i: int):
+                    body = {"prompt": f"bench {i}", "steps": 2}
+                    if seeded:
+                        body["seed"] = i % 10
+                    async with semaphore:
+                        start = time.perf_counter()
+                        response = await http.post("/generate", json=body)
+                        latencies.append(time.perf_counter() - start)
+                        statuses[response.status_code] += 1
+
+                start = time.perf_counter()
+                await asyncio.gather(*(generate(i) for i in range(requests)))
+                elapsed = time.perf_counter() - start
+            await app.m.pool.close()
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        return {
+            "miners": miners,
+            "requests": requests,
+            "concurrency": concurrency,
+            "requests_per_sec": requests / elapsed,
+            "latency": percentiles(latencies),
+            "statuses": dict(statuses),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def print_report(report: dict):
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(show_header=True)
+    table.add_column("metric")
+    table.add_column("value", justify="right")
+
+    def add(prefix: str, value):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                add(f"{prefix}.{k}" if prefix else str(k), v)
+        elif isinstance(value, float):
+            table.add_row(prefix, f"{value:.4f}")
+        else:
+            table.add_row(prefix, str(value))
+
+    add("", report)
+    Console().print(table)
@@ -0,0 +1,65 @@
+import random
+import threading
+import time
+
+from communex.types import Ss58Address
+
+from mosaic_subnet.bench.stub_miner import StubMiner
+
+
+class FakeCommuneClient:
+    """
+    Stands in for `CommuneClient` with a single subnet made of the given
+    validator key (uid 0) and stub miners. Every query sleeps `rpc_latency`
+    seconds; votes are recorded in `votes`.
+    """
+
+    def __init__(
+        self,
+        validator_key: Ss58Address,
+        miners: list[StubMiner],
+        netuid: int = 0,
+        subnet_name: str = "mosaic",
+        rpc_latency: float = 0.0,
+    ) -> None:
+        self.netuid = netuid
+        self.subnet_name = subnet_name
+        self.rpc_latency = rpc_latency
+        self.addresses = {0: "127.0.0.1:0"}
+        self.keys = {0: validator_key}
+        for miner in miners:
+            self.addresses[miner.uid] = miner.address
+            self.keys[miner.uid] = miner.key.ss58_address
+        self.weights = {
+            0: [(miner.uid, random.randint(1, 1000)) for miner in miners]
+        }
+        self.votes: list[tuple[list[int], list[int]]] = []
+        self.rpc_calls = 0
+        self._lock = threading.Lock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_calls += 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def query_map_subnet_names(self, extract_value: bool = False) -> dict[int, str]:
+        self._rpc()
+        return {self.netuid: self.subnet_name}
+
+    def query_map_address(self, netuid: int = 0, extract_value: bool = False):
+        self._rpc()
+        return dict(self.addresses)
+
+    def query_map_key(self, netuid: int = 0, extract_value: bool = False):
+        self._rpc()
+        return dict(self.keys)
+
+    def query_map_weights(self, netuid: int = 0, extract_value: bool = False):
+        self._rpc()
+        return dict(self.weights)
+
+    def vote(self, key, uids: list[int], weights: list[int], netuid: int = 0):
+        self._rpc()
+        with self._lock:
+            self.votes.append((uids, weights))
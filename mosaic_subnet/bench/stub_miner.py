@@ -0,0 +1,137 @@
+import asyncio
+import random
+import socket
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from PIL import Image
+from loguru import logger
+
+from substrateinterface import Keypair
+from communex.key import generate_keypair
+
+from mosaic_subnet.base.image_codec import encode_image, to_transport
+
+
+@dataclass
+class StubMinerConfig:
+    # seconds per sample call, drawn from a normal distribution
+    latency: float = 1.0
+    latency_jitter: float = 0.2
+    # share of sample calls answered with an error
+    failure_rate: float = 0.0
+    image_size: int = 512
+
+
+@lru_cache(maxsize=16)
+def stub_image(size: int, encoding: str, quality: Optional[int]) -> str:
+    # smooth gradient plus noise, so encoders do realistic work
+    gradient = np.linspace(0, 200, size, dtype=np.float32)
+    pixels = gradient[None, :, None] + np.random.rand(size, size, 3) * 40
+    image = Image.fromarray(pixels.astype(np.uint8))
+    return to_transport(encode_image(image, encoding, quality))
+
+
+def build_stub_miner_app(config: StubMinerConfig, model: str = "stub") -> FastAPI:
+    """
+    FastAPI app exposing the same `sample` and `get_metadata` methods as a
+    `DiffUsers` miner behind a communex `ModuleServer`, without signature or
+    chain checks.
+    """
+    app = FastAPI()
+
+    @app.post("/method/sample")
+    async def sample(body: dict):
+        params = body.get("params", {})
+        latency = max(random.gauss(config.latency, config.latency_jitter), 0)
+        await asyncio.sleep(latency)
+        if random.random() < config.failure_rate:
+            return JSONResponse(status_code=500, content={"error": "stub failure"})
+        return stub_image(
+            config.image_size, params.get("encoding", "png"), params.get("quality")
+        )
+
+    @app.post("/method/get_metadata")
+    async def get_metadata(body: dict):
+        return {"model": model}
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@dataclass
+class StubMiner:
+    uid: int
+    port: int
+    key: Keypair
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+
+class StubMinerFleet:
+    """
+    Runs `count` stub miners on local ports, all served from one event loop
+    in a background thread.
+    """
+
+    def __init__(self, count: int, config: StubMinerConfig) -> None:
+        self.config = config
+        self.miners = [
+            StubMiner(uid=uid, port=free_port(), key=generate_keypair())
+            for uid in range(1, count + 1)
+        ]
+        self._servers = [
+            uvicorn.Server(
+                uvicorn.Config(
+                    build_stub_miner_app(config),
+                    host="127.0.0.1",
+                    port=miner.port,
+                    log_level="warning",
+                    access_log=False,
+                )
+            )
+            for miner in self.miners
+        ]
+        self._thread: Optional[threading.Thread] = None
+
+    async def _serve(self):
+        await asyncio.gather(*(server.serve() for server in self._servers))
+
+    def start(self):
+        # encode the image once up front, not in the first timed request
+        stub_image(self.config.image_size, "png", None)
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self._serve(),), daemon=True
+        )
+        self._thread.start()
+        while not all(server.started for server in self._servers):
+            if not self._thread.is_alive():
+                raise RuntimeError("stub miners failed to start")
+            threading.Event().wait(0.05)
+        logger.info(f"started {len(self.miners)} stub miners")
+
+    def stop(self):
+        for server in self._servers:
+            server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
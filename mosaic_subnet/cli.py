@@ -1,4 +1,4 @@
-from typing import Annotated
+from typing import Annotated, Optional
 from dataclasses import dataclass
 import sys
 import os
@@ -7,8 +7,11 @@ sys.path.append(os.getcwd())
 
 import typer
 from loguru import logger
-from communex.compat.key import classic_load_key
 
+from mosaic_subnet.base.lazy import log_duration
+
+# subcommands import what they need, so --help and argument errors never
+# pay for communex, torch or diffusers
 cli = typer.Typer()
 
 
@@ -44,13 +47,19 @@ def validator(
     ],
     call_timeout: int = 60,
     iteration_interval: int = 60,
+    query_concurrency: int = 64,
+    metrics_port: Optional[int] = None,
 ):
-    from mosaic_subnet.validator import Validator, ValidatorSettings
+    with log_duration("importing the validator"):
+        from communex.compat.key import classic_load_key
+        from mosaic_subnet.validator import Validator, ValidatorSettings
 
     settings = ValidatorSettings(
         use_testnet=ctx.obj.use_testnet,
         iteration_interval=iteration_interval,
         call_timeout=call_timeout,
+        query_concurrency=query_concurrency,
+        metrics_port=metrics_port,
     )
     validator = Validator(key=classic_load_key(commune_key), settings=settings)
     validator.validation_loop()
@@ -65,10 +74,22 @@ def miner(
     host: Annotated[str, typer.Argument(help="the public ip you've registered, you can simply put 0.0.0.0 here to allow all incoming requests")],
     port: Annotated[int, typer.Argument(help="port")],
     testnet: bool = False,
+    device: Annotated[str, typer.Option(help="auto, cuda, mps or cpu")] = "auto",
+    precision: Annotated[str, typer.Option(help="auto, fp16, bf16 or fp32")] = "auto",
+    num_threads: Optional[int] = None,
 ):
-    from mosaic_subnet.miner import Miner, MinerSettings
+    with log_duration("importing the miner"):
+        from communex.compat.key import classic_load_key
+        from mosaic_subnet.miner import Miner, MinerSettings
 
-    settings = MinerSettings(use_testnet=ctx.obj.use_testnet, host=host, port=port)
+    settings = MinerSettings(
+        use_testnet=ctx.obj.use_testnet,
+        host=host,
+        port=port,
+        device=device,
+        precision=precision,
+        num_threads=num_threads,
+    )
     miner = Miner(key=classic_load_key(commune_key), settings=settings)
     miner.serve()
 
@@ -83,17 +104,102 @@ def gateway(
     port: Annotated[int, typer.Argument(help="port")],
     testnet: bool = False,
     call_timeout: int = 65,
+    workers: Annotated[
+        int, typer.Option(help="server processes sharing one chain sync and routing table")
+    ] = 1,
 ):
-    import uvicorn
-    from mosaic_subnet.gateway import app, Gateway, GatewaySettings
+    with log_duration("importing the gateway"):
+        import uvicorn
+        from communex.compat.key import classic_load_key
+        from mosaic_subnet.gateway import app, Gateway, GatewaySettings
+        from mosaic_subnet.gateway.coordinator import serve_workers
 
     settings = GatewaySettings(
-        use_testnet=ctx.obj.use_testnet, host=host, port=port, call_timeout=call_timeout
+        use_testnet=ctx.obj.use_testnet,
+        host=host,
+        port=port,
+        call_timeout=call_timeout,
+        workers=workers,
     )
+    if settings.workers > 1:
+        serve_workers(commune_key, settings, settings.workers)
+        return
     app.m = Gateway(key=classic_load_key(commune_key), settings=settings)
     app.m.start_sync_loop()
     uvicorn.run(app=app, host=settings.host, port=settings.port)
 
 
+@cli.command("bench-validator")
+def bench_validator(
+    miners: int = 50,
+    rounds: int = 5,
+    latency: float = 1.0,
+    latency_jitter: float = 0.2,
+    failure_rate: float = 0.0,
+    image_size: int = 512,
+    scorer: Annotated[str, typer.Option(help="clip or stub")] = "clip",
+    call_timeout: int = 10,
+    query_concurrency: int = 64,
+    rpc_latency: float = 0.0,
+):
+    """
+    Runs validate_step against local stub miners and a fake chain.
+    """
+    from mosaic_subnet.bench import bench_validator, print_report
+    from mosaic_subnet.bench.stub_miner import StubMinerConfig
+
+    config = StubMinerConfig(
+        latency=latency,
+        latency_jitter=latency_jitter,
+        failure_rate=failure_rate,
+        image_size=image_size,
+    )
+    report = bench_validator(
+        miners=miners,
+        rounds=rounds,
+        config=config,
+        scorer=scorer,
+        call_timeout=call_timeout,
+        query_concurrency=query_concurrency,
+        rpc_latency=rpc_latency,
+    )
+    print_report(report)
+
+
+@cli.command("bench-gateway")
+def bench_gateway(
+    miners: int = 16,
+    requests: int = 200,
+    concurrency: int = 16,
+    latency: float = 1.0,
+    latency_jitter: float = 0.2,
+    failure_rate: float = 0.0,
+    image_size: int = 512,
+    seeded: bool = False,
+    call_timeout: int = 10,
+):
+    """
+    Sends /generate requests through the gateway to local stub miners.
+    """
+    from mosaic_subnet.bench import bench_gateway, print_report
+    from mosaic_subnet.bench.stub_miner import StubMinerConfig
+
+    config = StubMinerConfig(
+        latency=latency,
+        latency_jitter=latency_jitter,
+        failure_rate=failure_rate,
+        image_size=image_size,
+    )
+    report = bench_gateway(
+        miners=miners,
+        requests=requests,
+        concurrency=concurrency,
+        config=config,
+        seeded=seeded,
+        call_timeout=call_timeout,
+    )
+    print_report(report)
+
+
 if __name__ == "__main__":
     cli()
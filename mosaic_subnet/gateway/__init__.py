@@ -1,4 +1,5 @@
-import random
+import asyncio
+import json
 import time
 import threading
 
@@ -6,12 +7,12 @@ from communex.client import CommuneClient
 from communex.types import Ss58Address
 from communex._common import get_node_url
 from substrateinterface import Keypair
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from communex.compat.key import classic_load_key
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, AsyncIterator, Iterator, Optional
 from loguru import logger
 
 import uvicorn
@@ -20,7 +21,33 @@ from mosaic_subnet.base.utils import (
     get_netuid,
 )
 from mosaic_subnet.base import SampleInput, BaseValidator
+from mosaic_subnet.base.chain import ChainSnapshot
+from mosaic_subnet.base.image_codec import (
+    MEDIA_TYPES,
+    ImageEncoding,
+    from_transport,
+    sniff_media_type,
+    to_transport,
+)
+from mosaic_subnet.base.pool import MinerConnectionPool
+from mosaic_subnet.base.query import call_miner, stream_miner
 from mosaic_subnet.gateway._config import GatewaySettings
+from mosaic_subnet.gateway.hedging import LatencyWindow, hedged_call
+from mosaic_subnet.gateway.routing import RoutingTable
+from mosaic_subnet.gateway.cache import ResultCache, result_key
+from mosaic_subnet.gateway.coordinator import CoordinatorClient
+from mosaic_subnet.gateway.screening import ImageScreener
+from mosaic_subnet.base.metrics import add_metrics_route, counter, histogram
+
+UPSTREAM_TIME = histogram(
+    "mosaic_gateway_upstream_seconds", "Miner call latency by outcome"
+)
+CACHE_LOOKUPS = counter("mosaic_gateway_cache_lookups_total", "Result cache lookups by result")
+REQUEST_TIME = histogram("mosaic_gateway_request_seconds", "/generate latency by status")
+BATCH_ITEMS = counter("mosaic_gateway_batch_items_total", "/generate/batch items by status")
+STREAM_TIME = histogram(
+    "mosaic_gateway_stream_seconds", "/generate/stream duration by final status"
+)
 
 
 app = FastAPI()
@@ -32,28 +59,89 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
 
 
 class Gateway(BaseValidator):
-    def __init__(self, key: Keypair, settings: GatewaySettings) -> None:
+    def __init__(
+        self,
+        key: Keypair,
+        settings: GatewaySettings,
+        c_client: CommuneClient | None = None,
+        coordinator_socket: Optional[str] = None,
+    ) -> None:
         super().__init__()
         self.settings = settings or GatewaySettings()
-        self.c_client = CommuneClient(
-            get_node_url(use_testnet=self.settings.use_testnet)
-        )
         self.key = key
-        self.netuid = get_netuid(self.c_client)
         self.call_timeout = self.settings.call_timeout
         self.top_miners = {}
+        self.latencies = LatencyWindow()
+        self.routing = RoutingTable(
+            alpha=self.settings.routing_ewma_alpha,
+            cooldown_failures=self.settings.cooldown_failures,
+            cooldown_seconds=self.settings.cooldown_seconds,
+        )
+        self.result_cache = None
+        if self.settings.result_cache:
+            self.result_cache = ResultCache(
+                max_memory_bytes=self.settings.result_cache_memory_bytes,
+                path=self.settings.result_cache_path,
+                max_disk_bytes=self.settings.result_cache_disk_bytes,
+                default_ttl=self.settings.result_cache_ttl,
+            )
+        self.screener = None
+        if self.settings.nsfw_screening:
+            # torch is only needed by gateways that screen
+            from mosaic_subnet.validator.model import NSFWChecker
+
+            checker = NSFWChecker(
+                model_name=self.settings.nsfw_model,
+                batch_size=self.settings.nsfw_batch_size,
+                threshold=self.settings.nsfw_threshold,
+            )
+            self.screener = ImageScreener(
+                checker.check_batch,
+                batch_size=self.settings.nsfw_batch_size,
+                window=self.settings.nsfw_batch_window,
+                cache_size=self.settings.nsfw_cache_size,
+            )
+        self.pool = MinerConnectionPool(
+            key,
+            limit_per_host=self.settings.pool_limit_per_host,
+            idle_timeout=self.settings.pool_idle_timeout,
+        )
+        self.coordinator = None
+        if coordinator_socket is not None:
+            # a worker of a multi-worker gateway, the coordinator syncs with
+            # the chain and shares its routing table
+            self.coordinator = CoordinatorClient(
+                coordinator_socket,
+                self.routing,
+                on_update=lambda: self.pool.update(self.routing.candidates),
+            )
+            return
+        self.c_client = c_client or CommuneClient(
+            get_node_url(use_testnet=self.settings.use_testnet)
+        )
+        self.chain = ChainSnapshot(
+            self.c_client,
+            netuid=self.settings.netuid,
+            modules_ttl=self.settings.chain_modules_ttl,
+            weights_ttl=self.settings.chain_weights_ttl,
+        )
+        self.chain.start()
+        self.netuid = self.chain.netuid
         self.sync()
 
     def sync(self):
         logger.info("fetch top miners")
-        self.top_miners = self.get_top_weights_miners(16)
+        self.top_miners = self.get_top_weights_miners(self.settings.top_miners)
+        self.routing.update_candidates(self.top_miners)
+        self.pool.update(self.top_miners)
 
     def sync_loop(self):
         while True:
-            time.sleep(300)
+            time.sleep(self.settings.chain_modules_ttl)
             self.sync()
 
     def start_sync_loop(self):
@@ -62,24 +150,303 @@ class Gateway(BaseValidator):
         self._loop_thread.start()
 
     def get_top_miners(self):
+        if self.coordinator is not None:
+            return self.routing.candidates
         return self.top_miners
 
+    def hedge_delay(self) -> float:
+        if self.settings.hedge_delay is not None:
+            return self.settings.hedge_delay
+        delay = self.latencies.quantile(self.settings.hedge_quantile)
+        if delay is None or len(self.latencies) < self.settings.hedge_min_samples:
+            return self.settings.hedge_default_delay
+        return max(delay, self.settings.hedge_min_delay)
+
+    async def screen(self, uid: int, image: bytes) -> bool:
+        """
+        Whether `image` may be served; always true without screening.
+        """
+        if self.screener is None:
+            return True
+        try:
+            if not await self.screener.is_nsfw(image):
+                return True
+            logger.info(f"miner {uid} returned an image flagged as nsfw")
+        except Exception as e:
+            logger.error(f"nsfw screening failed: {e}")
+        return False
+
+    async def call_miner(
+        self, uid: int, module, req: SampleInput, reserved: bool = False
+    ) -> Optional[bytes]:
+        """
+        Calls one miner and records the outcome in the routing table. With
+        `reserved`, the call was already started by `routing.reserve`.
+        """
+        if not reserved:
+            self.routing.start(uid)
+        start = time.monotonic()
+        try:
+            result = await call_miner(
+                self.key, module, req, timeout=self.call_timeout, pool=self.pool
+            )
+            if result and not await self.screen(uid, result):
+                result = None
+        except asyncio.CancelledError:
+            self.routing.cancel(uid)
+            UPSTREAM_TIME.observe(time.monotonic() - start, outcome="cancelled")
+            raise
+        latency = time.monotonic() - start
+        self.routing.finish(uid, latency, ok=bool(result))
+        UPSTREAM_TIME.observe(latency, outcome="ok" if result else "error")
+        if result:
+            self.latencies.record(latency)
+        return result
+
+    def reserved_call(self, slot: tuple[int, Any], req: SampleInput) -> asyncio.Task:
+        """
+        Calls the miner of a slot taken with `routing.reserve`. The slot is
+        released even if the task is cancelled before it starts running.
+        """
+        uid, module = slot
+        started = False
+
+        async def run():
+            nonlocal started
+            started = True
+            return await self.call_miner(uid, module, req, reserved=True)
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(lambda _: started or self.routing.cancel(uid))
+        return task
+
+    async def generate(
+        self, req: SampleInput, max_in_flight: Optional[int] = None
+    ) -> Optional[bytes]:
+        """
+        With `max_in_flight`, every call, hedges included, only goes to a
+        miner with fewer calls running; when all are busy, waits up to
+        call_timeout for one to free up.
+        """
+        key = None
+        if self.result_cache is not None:
+            key = result_key(req, self.settings.model)
+        if key is not None:
+            cached = await asyncio.to_thread(self.result_cache.get, key)
+            CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+        if max_in_flight is None:
+            candidates = self.routing.ranked()
+            call = lambda candidate: self.call_miner(*candidate, req)
+        else:
+            first = await self.routing.acquire(max_in_flight, timeout=self.call_timeout)
+            if first is None:
+                return None
+            candidates = self._reserve_candidates(first, max_in_flight)
+            call = lambda slot: self.reserved_call(slot, req)
+        _, result = await hedged_call(
+            candidates,
+            call,
+            hedge_delay=self.hedge_delay(),
+            max_attempts=self.settings.max_attempts,
+            timeout=self.call_timeout,
+        )
+        if result and key is not None:
+            await asyncio.to_thread(self.result_cache.put, key, result)
+        return result
+
+    def _reserve_candidates(
+        self, first: tuple[int, Any], max_in_flight: int
+    ) -> Iterator[tuple[int, Any]]:
+        # reserves lazily, when `hedged_call` starts the next call
+        tried = {first[0]}
+        yield first
+        while (slot := self.routing.reserve(max_in_flight, exclude=tried)) is not None:
+            tried.add(slot[0])
+            yield slot
+
+    async def generate_batch(
+        self, reqs: list[SampleInput]
+    ) -> AsyncIterator[tuple[int, Optional[bytes], Optional[str]]]:
+        """
+        Generates every request of a batch and yields `(index, image, error)`
+        as items finish. Items are spread over the candidates with at most
+        batch_max_in_flight_per_miner calls per miner, counting calls of
+        other requests and hedges, and fail one by one.
+        """
+        cap = self.settings.batch_max_in_flight_per_miner
+        parallel = cap * max(len(self.routing.candidates), 1)
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def run(index: int, req: SampleInput):
+            async with semaphore:
+                try:
+                    result = await self.generate(req, max_in_flight=cap)
+                except Exception as e:
+                    logger.error(e)
+                    return index, None, str(e)
+            if not result:
+                return index, None, "no miner returned an image"
+            return index, result, None
+
+        tasks = [asyncio.create_task(run(i, req)) for i, req in enumerate(reqs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_stream(
+        self, req: SampleInput, preview_every: int
+    ) -> AsyncIterator[dict]:
+        """
+        Yields "preview" events relayed from one miner, then a final "image"
+        event, or an "error" event. Miners are tried in routing order until
+        one starts streaming; there is no hedging, since the caller is
+        already watching the previews of the first one.
+        """
+        key = None
+        if self.result_cache is not None:
+            key = result_key(req, self.settings.model)
+        if key is not None:
+            cached = await asyncio.to_thread(self.result_cache.get, key)
+            CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                yield {"event": "image", "image": cached}
+                return
+        for uid, module in self.routing.ranked()[: self.settings.max_attempts]:
+            self.routing.start(uid)
+            start = time.monotonic()
+            started = False
+            # set once finish ran; otherwise the call was cancelled, or the
+            # client went away while the generator was suspended
+            finished = False
+            try:
+                async for event in stream_miner(
+                    self.key, module, req, self.call_timeout, preview_every, pool=self.pool
+                ):
+                    if event["event"] == "error":
+                        raise Exception(event["message"])
+                    started = True
+                    if event["event"] == "image":
+                        result = from_transport(event["image"])
+                        if not await self.screen(uid, result):
+                            raise Exception("image rejected by nsfw screening")
+                        latency = time.monotonic() - start
+                        self.routing.finish(uid, latency, ok=True)
+                        finished = True
+                        self.latencies.record(latency)
+                        UPSTREAM_TIME.observe(latency, outcome="ok")
+                        if key is not None:
+                            await asyncio.to_thread(self.result_cache.put, key, result)
+                        yield {"event": "image", "image": result}
+                        return
+                    yield event
+                raise Exception(f"miner {uid} ended the stream without an image")
+            except Exception as e:
+                logger.error(e)
+                if not finished:
+                    latency = time.monotonic() - start
+                    self.routing.finish(uid, latency, ok=False)
+                    finished = True
+                    UPSTREAM_TIME.observe(latency, outcome="error")
+            finally:
+                if not finished:
+                    self.routing.cancel(uid)
+                    UPSTREAM_TIME.observe(time.monotonic() - start, outcome="cancelled")
+            if started:
+                break
+        yield {"event": "error", "message": "no miner returned an image"}
+
 
 @app.post(
     "/generate",
-    responses={200: {"content": {"image/png": {}}}},
+    responses={200: {"content": {t: {} for t in MEDIA_TYPES.values()}}},
     response_class=Response,
 )
-def generate_image(req: SampleInput):
-    result = b""
-    for i in range(3):
-        top_miners = app.m.get_top_miners()
-        mid = random.choice(list(top_miners.keys()))
-        module = top_miners[mid]
-        result = app.m.get_miner_generation(module, req)
-        if result:
-            break
-    return Response(content=result, media_type="image/png")
+async def generate_image(req: SampleInput):
+    start = time.monotonic()
+    result = await app.m.generate(req)
+    if not result:
+        REQUEST_TIME.observe(time.monotonic() - start, status="503")
+        raise HTTPException(status_code=503, detail="no miner returned an image")
+    REQUEST_TIME.observe(time.monotonic() - start, status="200")
+    return Response(content=result, media_type=sniff_media_type(result))
+
+
+@app.post("/generate/batch")
+async def generate_image_batch(reqs: list[SampleInput]):
+    """
+    Newline-delimited JSON, one line per item in completion order:
+    `{"index", "status": "ok", "media_type", "image"}` with a base64 image,
+    or `{"index", "status": "error", "error"}`.
+    """
+    if len(reqs) > app.m.settings.batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"at most {app.m.settings.batch_max_items} items per batch",
+        )
+
+    async def items():
+        async for index, result, error in app.m.generate_batch(reqs):
+            if result:
+                BATCH_ITEMS.inc(status="ok")
+                item = {
+                    "index": index,
+                    "status": "ok",
+                    "media_type": sniff_media_type(result),
+                    "image": to_transport(result),
+                }
+            else:
+                BATCH_ITEMS.inc(status="error")
+                item = {"index": index, "status": "error", "error": error}
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(items(), media_type="application/x-ndjson")
+
+
+def format_event(event: dict) -> str:
+    data = dict(event)
+    name = data.pop("event")
+    if name == "preview":
+        data["media_type"] = MEDIA_TYPES[ImageEncoding.JPEG]
+    elif name == "image":
+        data["media_type"] = sniff_media_type(data["image"])
+        data["image"] = to_transport(data["image"])
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/generate/stream")
+async def generate_image_stream(req: SampleInput, preview_every: int = 4):
+    """
+    Server-sent events: "preview" events carrying a small base64 jpeg every
+    `preview_every` steps, then one "image" or "error" event.
+    """
+
+    async def events():
+        start = time.monotonic()
+        status = "503"
+        async for event in app.m.generate_stream(req, max(1, preview_every)):
+            if event["event"] == "image":
+                status = "200"
+            yield format_event(event)
+        STREAM_TIME.observe(time.monotonic() - start, status=status)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/debug/routing")
+def routing_table():
+    return app.m.routing.snapshot()
+
+
+@app.get("/debug/cache")
+def result_cache_stats():
+    if app.m.result_cache is None:
+        return {}
+    return app.m.result_cache.stats()
 
 
 if __name__ == "__main__":
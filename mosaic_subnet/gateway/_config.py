@@ -1,7 +1,48 @@
 from mosaic_subnet.base.config import MosaicBaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class GatewaySettings(MosaicBaseSettings):
     host: str
     port: int
+    # server processes; above 1 a coordinator process syncs with the chain
+    # and shares one routing table with all of them
+    workers: int = 1
+    # unix socket of the coordinator, defaults to one per port in the temp dir
+    coordinator_socket: Optional[str] = None
+    # seconds between routing table updates sent to the workers
+    coordinator_publish_interval: float = 0.5
+    # number of miners, by chain weight, requests are routed to
+    top_miners: int = 16
+    routing_ewma_alpha: float = 0.2
+    # consecutive failures before a miner is skipped for cooldown_seconds
+    cooldown_failures: int = 3
+    cooldown_seconds: float = 60
+    # cache of seeded generations, keyed by the request and the served model
+    result_cache: bool = True
+    model: str = "stabilityai/sdxl-turbo"
+    result_cache_memory_bytes: int = 256 * 1024 * 1024
+    # directory of the on-disk tier, None keeps the cache in memory only
+    result_cache_path: Optional[str] = None
+    result_cache_disk_bytes: int = 4 * 1024 * 1024 * 1024
+    result_cache_ttl: float = 24 * 3600
+    # miners tried per request, including hedged requests
+    max_attempts: int = 3
+    # fixed delay before a hedged request, None adapts it to observed latency
+    hedge_delay: Optional[float] = None
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 0.5
+    # used until hedge_min_samples latencies have been observed
+    hedge_default_delay: float = 5.0
+    hedge_min_samples: int = 20
+    # /generate/batch: items per request and calls per miner at a time
+    batch_max_items: int = 1024
+    batch_max_in_flight_per_miner: int = 4
+    # screen miner images before serving them, needs torch and transformers
+    nsfw_screening: bool = False
+    nsfw_model: str = "Falconsai/nsfw_image_detection"
+    nsfw_batch_size: int = 8
+    nsfw_batch_window: float = 0.01
+    nsfw_threshold: float = 0.8
+    # verdicts kept by image hash
+    nsfw_cache_size: int = 10000
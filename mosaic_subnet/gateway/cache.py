@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+
+from mosaic_subnet.base import SampleInput
+
+# every disk entry starts with its expiry time
+HEADER = struct.Struct("<d")
+
+
+def result_key(req: SampleInput, model: str) -> Optional[str]:
+    """
+    Content address of a request. Only seeded requests are deterministic,
+    unseeded ones return None and must not be cached.
+    """
+    if req.seed is None:
+        return None
+    payload = json.dumps(
+        [model, req.prompt, req.negative_prompt, req.steps, req.seed,
+         req.encoding.value, req.quality]
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Generated images keyed by `result_key`.
+
+    A size-bounded in-memory LRU sits in front of an optional on-disk store
+    with its own byte budget; both evict least recently used entries first.
+    Entries expire after their ttl.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 256 * 1024 * 1024,
+        path: Optional[str] = None,
+        max_disk_bytes: int = 4 * 1024 * 1024 * 1024,
+        default_ttl: float = 24 * 3600,
+    ) -> None:
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.default_ttl = default_ttl
+        self.path = path
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self._load_disk_index()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.bin")
+
+    def _load_disk_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".bin"):
+                continue
+            st = os.stat(os.path.join(self.path, name))
+            entries.append((st.st_mtime, name[: -len(".bin")], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+        logger.info(f"result cache: {len(self._disk)} entries on disk")
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._drop_memory(key)
+            value = self._get_disk(key, now)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def _get_disk(self, key: str, now: float) -> Optional[bytes]:
+        if key not in self._disk:
+            return None
+        try:
+            with open(self._file(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            self._drop_disk(key)
+            return None
+        (expires,) = HEADER.unpack_from(data)
+        if expires <= now:
+            self._drop_disk(key)
+            return None
+        self._disk.move_to_end(key)
+        value = data[HEADER.size :]
+        self._put_memory(key, expires, value)
+        return value
+
+    def put(self, key: str, value: bytes, ttl: Optional[float] = None):
+        expires = time.time() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._put_memory(key, expires, value)
+            if self.path:
+                self._put_disk(key, expires, value)
+
+    def _put_memory(self, key: str, expires: float, value: bytes):
+        if len(value) > self.max_memory_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (expires, value)
+        self.memory_bytes += len(value)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _put_disk(self, key: str, expires: float, value: bytes):
+        size = HEADER.size + len(value)
+        if size > self.max_disk_bytes:
+            return
+        tmp = self._file(key) + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(expires))
+                f.write(value)
+            os.replace(tmp, self._file(key))
+        except OSError as e:
+            logger.error(e)
+            return
+        self.disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = size
+        self.disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes and self._disk:
+            self._drop_disk(next(iter(self._disk)))
+
+    def _drop_memory(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[1])
+
+    def _drop_disk(self, key: str):
+        self.disk_bytes -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
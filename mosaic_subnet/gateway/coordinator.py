@@ -0,0 +1,264 @@
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import IO, Callable, Optional
+
+from loguru import logger
+
+from mosaic_subnet.gateway._config import GatewaySettings
+from mosaic_subnet.gateway.routing import RoutingTable
+
+# how the coordinator hands its configuration to the worker processes
+SETTINGS_ENV = "MOSAIC_GATEWAY_SETTINGS"
+KEY_ENV = "MOSAIC_GATEWAY_KEY"
+SOCKET_ENV = "MOSAIC_GATEWAY_SOCKET"
+
+# a routing table of a few hundred miners fits easily
+STREAM_LIMIT = 16 * 1024 * 1024
+
+
+def default_socket_path(port: int) -> str:
+    return os.path.join(tempfile.gettempdir(), f"mosaic-gateway-{port}.sock")
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message).encode() + b"\n"
+
+
+class Coordinator:
+    """
+    Shares one routing table between the worker processes of a gateway.
+
+    Workers connect to a unix socket and receive the table, candidates and
+    merged per-miner stats, every `publish_interval` seconds. In return they
+    send the outcomes of their miner calls, which are merged into the table
+    here. Chain sync happens only in the process owning `routing`.
+    """
+
+    def __init__(
+        self,
+        routing: RoutingTable,
+        socket_path: str,
+        publish_interval: float = 0.5,
+    ) -> None:
+        self.routing = routing
+        self.socket_path = socket_path
+        self.publish_interval = publish_interval
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            writer.write(encode(self.routing.shared_state()))
+            await writer.drain()
+            while line := await reader.readline():
+                for uid, latency, ok in json.loads(line)["outcomes"]:
+                    self.routing.record(uid, latency, ok)
+        except (ConnectionError, ValueError, KeyError) as e:
+            logger.warning(f"dropping gateway worker: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            if not self._writers:
+                continue
+            message = encode(self.routing.shared_state())
+            for writer in list(self._writers):
+                try:
+                    writer.write(message)
+                    await writer.drain()
+                except ConnectionError:
+                    self._writers.discard(writer)
+
+    async def run(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(
+            self._handle, path=self.socket_path, limit=STREAM_LIMIT
+        )
+        logger.info(f"gateway coordinator listening on {self.socket_path}")
+        async with server:
+            await asyncio.gather(server.serve_forever(), self._publish_loop())
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        thread.start()
+        return thread
+
+
+class CoordinatorClient:
+    """
+    Keeps the routing table of a gateway worker in sync with the coordinator
+    and reports the worker's miner call outcomes every `report_interval`
+    seconds. Reconnects when the coordinator goes away; in the meantime the
+    worker keeps routing on its last table. `on_update` is called after every
+    table received.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        routing: RoutingTable,
+        report_interval: float = 0.2,
+        on_update: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.socket_path = socket_path
+        self.routing = routing
+        self.report_interval = report_interval
+        self.on_update = on_update
+        self._outcomes: list[tuple[int, float, bool]] = []
+        self._task: Optional[asyncio.Task] = None
+        routing.reporter = lambda uid, latency, ok: self._outcomes.append(
+            (uid, latency, ok)
+        )
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        while line := await reader.readline():
+            self.routing.load_shared(json.loads(line))
+            if self.on_update is not None:
+                self.on_update()
+        raise ConnectionError("coordinator closed the connection")
+
+    async def _report(self, writer: asyncio.StreamWriter):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            if not self._outcomes:
+                continue
+            outcomes, self._outcomes = self._outcomes, []
+            writer.write(encode({"outcomes": outcomes}))
+            await writer.drain()
+
+    async def run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    self.socket_path, limit=STREAM_LIMIT
+                )
+            except OSError as e:
+                logger.warning(f"can't reach gateway coordinator: {e}")
+                await asyncio.sleep(1)
+                continue
+            tasks = [
+                asyncio.create_task(self._receive(reader)),
+                asyncio.create_task(self._report(writer)),
+            ]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    logger.warning(f"gateway coordinator connection lost: {task.exception()}")
+            finally:
+                for task in tasks:
+                    task.cancel()
+                writer.close()
+            await asyncio.sleep(1)
+
+    def start(self):
+        """
+        Starts syncing on the running event loop.
+        """
+        self._task = asyncio.create_task(self.run())
+
+
+def claim_worker_slot(directory: str, slots: int, timeout: float = 30) -> tuple[int, IO]:
+    """
+    Claims the first free of `slots` slots through an exclusive lock on
+    `directory/worker-<slot>.lock`. The slot stays claimed while the returned
+    file is open, and is freed when the process exits, so a restarted worker
+    takes over the slot of the one it replaces.
+    """
+    os.makedirs(directory, exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        for slot in range(slots):
+            lock = open(os.path.join(directory, f"worker-{slot}.lock"), "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot, lock
+            except BlockingIOError:
+                lock.close()
+        # a replaced worker may still be exiting
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"all {slots} worker slots in {directory} are taken")
+        time.sleep(0.5)
+
+
+def worker_cache_settings(settings: GatewaySettings, slot: int) -> GatewaySettings:
+    """
+    Gives a worker its own result cache directory and an equal share of the
+    memory and disk budgets, so the workers together stay within them.
+    """
+    workers = max(settings.workers, 1)
+    return settings.model_copy(
+        update={
+            "result_cache_path": os.path.join(settings.result_cache_path, f"worker-{slot}"),
+            "result_cache_memory_bytes": settings.result_cache_memory_bytes // workers,
+            "result_cache_disk_bytes": settings.result_cache_disk_bytes // workers,
+        }
+    )
+
+
+def create_worker_app():
+    """
+    uvicorn app factory of a gateway worker, configured by `serve_workers`
+    through the environment.
+    """
+    from communex.compat.key import classic_load_key
+
+    from mosaic_subnet.gateway import Gateway, app
+
+    settings = GatewaySettings.model_validate_json(os.environ[SETTINGS_ENV])
+    if settings.result_cache and settings.result_cache_path:
+        # workers don't share a disk tier, each indexes and evicts its own
+        slot, app.state.cache_slot_lock = claim_worker_slot(
+            settings.result_cache_path, settings.workers
+        )
+        settings = worker_cache_settings(settings, slot)
+    app.m = Gateway(
+        key=classic_load_key(os.environ[KEY_ENV]),
+        settings=settings,
+        coordinator_socket=os.environ[SOCKET_ENV],
+    )
+    app.add_event_handler("startup", app.m.coordinator.start)
+    return app
+
+
+def serve_workers(key_name: str, settings: GatewaySettings, workers: int):
+    """
+    Runs a gateway as `workers` uvicorn processes. This process syncs with
+    the chain, owns the routing table and coordinates the workers; it
+    serves no requests itself. Every worker has its own result cache, see
+    `worker_cache_settings`.
+    """
+    import uvicorn
+    from communex.compat.key import classic_load_key
+
+    from mosaic_subnet.gateway import Gateway
+
+    socket_path = settings.coordinator_socket or default_socket_path(settings.port)
+    # caches and screening only matter where requests are served
+    owner = Gateway(
+        key=classic_load_key(key_name),
+        settings=settings.model_copy(update={"result_cache": False, "nsfw_screening": False}),
+    )
+    owner.start_sync_loop()
+    Coordinator(
+        owner.routing, socket_path, publish_interval=settings.coordinator_publish_interval
+    ).start()
+    settings = settings.model_copy(update={"workers": workers})
+    os.environ[SETTINGS_ENV] = settings.model_dump_json()
+    os.environ[KEY_ENV] = key_name
+    os.environ[SOCKET_ENV] = socket_path
+    uvicorn.run(
+        "mosaic_subnet.gateway.coordinator:create_worker_app",
+        factory=True,
+        host=settings.host,
+        port=settings.port,
+        workers=workers,
+    )
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+
+from loguru import logger
+
+from mosaic_subnet.base.metrics import counter
+
+HEDGES = counter("mosaic_gateway_hedges_total", "Requests started because the first was slow")
+RETRIES = counter("mosaic_gateway_retries_total", "Requests started because one failed")
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """
+    Latencies of the most recent successful miner calls.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+async def hedged_call(
+    candidates: Iterable[T],
+    call: Callable[[T], Awaitable[Optional[bytes]]],
+    hedge_delay: float,
+    max_attempts: int,
+    timeout: float,
+) -> tuple[Optional[T], Optional[bytes]]:
+    """
+    Calls `candidates` in order until one returns a non-empty result.
+
+    A new candidate is started whenever a call fails, and also when no call
+    has finished within `hedge_delay` seconds of the last start. At most
+    `max_attempts` calls are made and the whole operation is bounded by
+    `timeout`. The first result wins and the remaining calls are cancelled.
+    `call` may return a coroutine or an already scheduled task.
+    """
+    deadline = time.monotonic() + timeout
+    candidates = iter(candidates)
+    running: dict[asyncio.Task, T] = {}
+    attempts = 0
+
+    def launch() -> bool:
+        nonlocal attempts
+        if attempts >= max_attempts:
+            return False
+        candidate = next(candidates, None)
+        if candidate is None:
+            return False
+        attempts += 1
+        running[asyncio.ensure_future(call(candidate))] = candidate
+        return True
+
+    launch()
+    try:
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(
+                running,
+                timeout=min(hedge_delay, remaining),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                if launch():
+                    HEDGES.inc()
+                    logger.debug(f"hedging after {hedge_delay:.2f}s")
+                continue
+            for task in done:
+                candidate = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.error(e)
+                    result = None
+                if result:
+                    return candidate, result
+                if launch():
+                    RETRIES.inc()
+    finally:
+        for task in running:
+            task.cancel()
+    return None, None
@@ -0,0 +1,251 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Container, Optional
+
+from mosaic_subnet.base.query import MinerInfo
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+@dataclass
+class MinerStats:
+    ewma_latency: Optional[float] = None
+    # EWMA of the failure indicator, 0 = always succeeds
+    error_rate: float = 0.0
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+
+
+class RoutingTable:
+    """
+    Per-miner latency and success stats collected from live gateway traffic.
+
+    `ranked` orders the current candidates by expected completion time:
+    EWMA latency, scaled by the requests already in flight and by the
+    expected number of tries given the error rate. Miners that fail
+    `cooldown_failures` times in a row are skipped for `cooldown_seconds`.
+    Stats are kept per uid, so they survive a candidate set change.
+
+    `reserve` and `acquire` start a call on the best miner with fewer than a
+    given number of calls in flight, atomically, so concurrent batch items
+    never push a miner over its cap.
+
+    In a multi-worker gateway every worker reports outcomes to `reporter`
+    and regularly replaces its table with the coordinator's merged view
+    through `load_shared`; only the in-flight counts stay local.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        cooldown_failures: int = 3,
+        cooldown_seconds: float = 60,
+        jitter: float = 0.1,
+    ) -> None:
+        self.alpha = alpha
+        self.cooldown_failures = cooldown_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.jitter = jitter
+        self.candidates: dict[int, MinerInfo] = {}
+        self.stats: dict[int, MinerStats] = {}
+        # called with (uid, latency, ok) after every finished call
+        self.reporter: Optional[Callable[[int, float, bool], None]] = None
+        self._lock = threading.Lock()
+        # futures of `acquire` calls waiting for a miner to free up
+        self._waiters: dict[asyncio.Future, asyncio.AbstractEventLoop] = {}
+
+    def update_candidates(self, candidates: dict[int, MinerInfo]):
+        with self._lock:
+            self.candidates = dict(candidates)
+            for uid in candidates:
+                self.stats.setdefault(uid, MinerStats())
+        self._wake_waiters()
+
+    def _expected_time(self, stats: MinerStats, unknown_latency: float) -> float:
+        latency = stats.ewma_latency if stats.ewma_latency is not None else unknown_latency
+        success_rate = max(1.0 - stats.error_rate, 0.05)
+        return latency * (1 + stats.in_flight) / success_rate
+
+    def ranked(self, max_in_flight: Optional[int] = None) -> list[tuple[int, MinerInfo]]:
+        """
+        Candidates, best first. Miners with `max_in_flight` calls running
+        are left out.
+        """
+        now = time.monotonic()
+        with self._lock:
+            known = [
+                s.ewma_latency
+                for uid, s in self.stats.items()
+                if uid in self.candidates and s.ewma_latency is not None
+            ]
+            # optimistic guess so that new miners get tried
+            unknown_latency = min(known) if known else 1.0
+            scored = []
+            cooling = []
+            for uid, module in self.candidates.items():
+                stats = self.stats[uid]
+                if max_in_flight is not None and stats.in_flight >= max_in_flight:
+                    continue
+                expected = self._expected_time(stats, unknown_latency)
+                expected *= random.uniform(1 - self.jitter, 1 + self.jitter)
+                if stats.cooldown_until > now:
+                    cooling.append((stats.cooldown_until, uid, module))
+                else:
+                    scored.append((expected, uid, module))
+        scored.sort(key=lambda x: x[0])
+        cooling.sort(key=lambda x: x[0])
+        # cooled down miners are only used when nothing else is left
+        return [(uid, module) for _, uid, module in scored + cooling]
+
+    def reserve(
+        self, max_in_flight: int, exclude: Container[int] = ()
+    ) -> Optional[tuple[int, MinerInfo]]:
+        """
+        Starts a call on the best ranked miner not in `exclude` with fewer
+        than `max_in_flight` calls running, or returns None if there is none.
+        """
+        for uid, module in self.ranked(max_in_flight):
+            if uid in exclude:
+                continue
+            with self._lock:
+                stats = self.stats[uid]
+                if stats.in_flight < max_in_flight:
+                    stats.in_flight += 1
+                    return uid, module
+        return None
+
+    async def acquire(
+        self, max_in_flight: int, timeout: float, poll_interval: float = 1.0
+    ) -> Optional[tuple[int, MinerInfo]]:
+        """
+        Like `reserve`, but waits up to `timeout` seconds for a call to
+        finish when every miner is at `max_in_flight`.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            # registered before reserving, so a release in between isn't missed
+            future = loop.create_future()
+            with self._lock:
+                self._waiters[future] = loop
+            try:
+                slot = self.reserve(max_in_flight)
+                remaining = deadline - time.monotonic()
+                if slot is not None or remaining <= 0:
+                    return slot
+                # polls too, since miners also come back from cooldown
+                await asyncio.wait({future}, timeout=min(remaining, poll_interval))
+            finally:
+                with self._lock:
+                    self._waiters.pop(future, None)
+
+    def _wake_waiters(self):
+        with self._lock:
+            waiters, self._waiters = self._waiters, {}
+        for future, loop in waiters.items():
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def start(self, uid: int):
+        with self._lock:
+            self.stats.setdefault(uid, MinerStats()).in_flight += 1
+
+    def cancel(self, uid: int):
+        with self._lock:
+            stats = self.stats[uid]
+            stats.in_flight = max(stats.in_flight - 1, 0)
+        self._wake_waiters()
+
+    def finish(self, uid: int, latency: float, ok: bool):
+        with self._lock:
+            stats = self.stats[uid]
+            stats.in_flight = max(stats.in_flight - 1, 0)
+        self._wake_waiters()
+        self.record(uid, latency, ok)
+        if self.reporter is not None:
+            self.reporter(uid, latency, ok)
+
+    def record(self, uid: int, latency: float, ok: bool):
+        """
+        Updates the stats of `uid` with the outcome of a call that is not
+        counted as in flight here.
+        """
+        with self._lock:
+            stats = self.stats.setdefault(uid, MinerStats())
+            stats.requests += 1
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok:
+                stats.consecutive_failures = 0
+                if stats.ewma_latency is None:
+                    stats.ewma_latency = latency
+                else:
+                    stats.ewma_latency += self.alpha * (latency - stats.ewma_latency)
+                return
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.cooldown_failures:
+                stats.cooldown_until = time.monotonic() + self.cooldown_seconds
+
+    def shared_state(self) -> dict:
+        """
+        Candidates and stats as JSON-compatible data for `load_shared`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "candidates": {uid: list(module) for uid, module in self.candidates.items()},
+                "stats": {
+                    uid: {
+                        "ewma_latency": stats.ewma_latency,
+                        "error_rate": stats.error_rate,
+                        "requests": stats.requests,
+                        "failures": stats.failures,
+                        "consecutive_failures": stats.consecutive_failures,
+                        "cooldown_remaining": max(stats.cooldown_until - now, 0.0),
+                    }
+                    for uid, stats in self.stats.items()
+                },
+            }
+
+    def load_shared(self, state: dict):
+        """
+        Replaces candidates and stats with `shared_state` data from another
+        process, keeping the local in-flight counts.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.candidates = {
+                int(uid): (module[0], module[1])
+                for uid, module in state["candidates"].items()
+            }
+            for uid, shared in state["stats"].items():
+                stats = self.stats.setdefault(int(uid), MinerStats())
+                stats.ewma_latency = shared["ewma_latency"]
+                stats.error_rate = shared["error_rate"]
+                stats.requests = shared["requests"]
+                stats.failures = shared["failures"]
+                stats.consecutive_failures = shared["consecutive_failures"]
+                stats.cooldown_until = now + shared["cooldown_remaining"]
+            for uid in self.candidates:
+                self.stats.setdefault(uid, MinerStats())
+        self._wake_waiters()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                uid: {
+                    **asdict(stats),
+                    "candidate": uid in self.candidates,
+                    "cooldown_remaining": max(stats.cooldown_until - now, 0.0),
+                }
+                for uid, stats in self.stats.items()
+            }
@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from loguru import logger
+
+from mosaic_subnet.base.metrics import counter
+
+SCREEN_LOOKUPS = counter(
+    "mosaic_gateway_screen_cache_lookups_total", "NSFW verdict cache lookups by result"
+)
+
+
+class ImageScreener:
+    """
+    Screens images on the event loop without blocking it.
+
+    Images from concurrent requests are collected for up to `window` seconds,
+    up to `batch_size`, and classified together by `check_batch` in a worker
+    thread. Verdicts are cached by image hash, so cached results and images
+    served twice are never classified again.
+    """
+
+    def __init__(
+        self,
+        check_batch: Callable[[list[bytes]], list[bool]],
+        batch_size: int = 8,
+        window: float = 0.01,
+        cache_size: int = 10000,
+    ) -> None:
+        self.check_batch = check_batch
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self.cache_size = cache_size
+        self._verdicts: OrderedDict[bytes, bool] = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _cached(self, digest: bytes) -> Optional[bool]:
+        with self._lock:
+            verdict = self._verdicts.get(digest)
+            if verdict is not None:
+                self._verdicts.move_to_end(digest)
+            return verdict
+
+    def _remember(self, digest: bytes, verdict: bool):
+        with self._lock:
+            self._verdicts[digest] = verdict
+            self._verdicts.move_to_end(digest)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+
+    async def is_nsfw(self, image: bytes) -> bool:
+        digest = hashlib.sha256(image).digest()
+        verdict = self._cached(digest)
+        SCREEN_LOOKUPS.inc(result="miss" if verdict is None else "hit")
+        if verdict is not None:
+            return verdict
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((digest, image, future))
+        return await future
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                verdicts = await asyncio.to_thread(
+                    self.check_batch, [image for _, image, _ in batch]
+                )
+            except Exception as e:
+                logger.error(e)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (digest, _, future), verdict in zip(batch, verdicts):
+                self._remember(digest, verdict)
+                if not future.done():
+                    future.set_result(verdict)
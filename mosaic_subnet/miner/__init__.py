@@ -10,21 +10,52 @@ from communex._common import get_node_url
 
 from mosaic_subnet.miner.model import DiffUsers
 from mosaic_subnet.miner._config import MinerSettings
-from mosaic_subnet.base.utils import get_netuid
+from mosaic_subnet.miner.admission import add_admission_middleware
+from mosaic_subnet.miner.streaming import add_stream_route
+from mosaic_subnet.miner.batching import DEFAULT_PRIORITY, VALIDATOR_PRIORITY
+from mosaic_subnet.base.chain import ChainSnapshot
+from mosaic_subnet.base.metrics import add_metrics_route
 import sys
+from typing import Optional
 
 from loguru import logger
 
 
 class Miner(DiffUsers):
     def __init__(self, key: Keypair, settings: MinerSettings = None) -> None:
-        super().__init__()
         self.settings = settings or MinerSettings()
+        super().__init__(
+            model_name=self.settings.model,
+            max_batch_size=self.settings.max_batch_size,
+            batch_window=self.settings.batch_window,
+            max_queue_size=self.settings.max_queue_size,
+            device=self.settings.device,
+            precision=self.settings.precision,
+            num_threads=self.settings.num_threads,
+            attention_slicing=self.settings.attention_slicing,
+            channels_last=self.settings.channels_last,
+            warmup=self.settings.warmup,
+        )
         self.key = key
         self.c_client = CommuneClient(
             get_node_url(use_testnet=self.settings.use_testnet)
         )
-        self.netuid = get_netuid(self.c_client)
+        self.chain = ChainSnapshot(
+            self.c_client,
+            netuid=self.settings.netuid,
+            modules_ttl=self.settings.chain_modules_ttl,
+            weights_ttl=self.settings.chain_weights_ttl,
+        )
+        self.chain.start()
+        self.netuid = self.chain.netuid
+        self.priority_keys = frozenset(self.settings.priority_keys)
+
+    def caller_priority(self, key: Optional[str]) -> int:
+        if key is not None and (
+            key in self.priority_keys or key in self.chain.state.validator_keys
+        ):
+            return VALIDATOR_PRIORITY
+        return DEFAULT_PRIORITY
 
     def serve(self):
         from communex.module.server import ModuleServer
@@ -32,6 +63,9 @@ class Miner(DiffUsers):
 
         server = ModuleServer(self, self.key, subnets_whitelist=[self.netuid])
         app = server.get_fastapi_app()
+        add_admission_middleware(app, self)
+        add_stream_route(app, self, self.key, subnets_whitelist=[self.netuid])
+        add_metrics_route(app)
         uvicorn.run(app, host=self.settings.host, port=self.settings.port)
 
 
@@ -1,8 +1,26 @@
 from mosaic_subnet.base.config import MosaicBaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class MinerSettings(MosaicBaseSettings):
     host: str
     port: int
     model: str = "stabilityai/sdxl-turbo"
+    # max number of concurrent sample calls run as one pipeline batch
+    max_batch_size: int = 4
+    # seconds to wait for more requests after the first one of a batch
+    batch_window: float = 0.05
+    # sample calls waiting for a batch, more are rejected with a 503
+    max_queue_size: int = 32
+    # ss58 keys served before everyone else, on top of the validators on chain
+    priority_keys: List[str] = []
+    # auto picks cuda, then mps, then cpu
+    device: str = "auto"
+    # fp16, bf16 or fp32, auto uses fp16 on gpus and fp32 on cpu
+    precision: str = "auto"
+    # torch intra-op threads, defaults to the number of cores
+    num_threads: Optional[int] = None
+    attention_slicing: bool = False
+    channels_last: bool = False
+    # run one generation at startup so the first request isn't slow
+    warmup: bool = True
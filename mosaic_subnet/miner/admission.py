@@ -0,0 +1,48 @@
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from substrateinterface.utils.ss58 import ss58_encode
+
+if TYPE_CHECKING:
+    from mosaic_subnet.miner.model import DiffUsers
+
+# ss58 address of the caller of the request being handled
+caller_key: ContextVar[Optional[str]] = ContextVar("caller_key", default=None)
+
+RETRY_AFTER = "1"
+# module calls that go through the request queue
+QUEUED_PATHS = ("/method/sample", "/method/sample_stream")
+
+
+def queue_full_response(message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"code": 503, "message": message}},
+        headers={"Retry-After": RETRY_AFTER},
+    )
+
+
+def add_admission_middleware(app: FastAPI, module: "DiffUsers"):
+    """
+    Records the caller key of every module call for `DiffUsers.sample` and
+    rejects sample calls the queue can't take before their signature and
+    registration are checked.
+    """
+
+    async def admit(request: Request, call_next):
+        if not request.url.path.startswith("/method/"):
+            return await call_next(request)
+        key = request.headers.get("x-key")
+        try:
+            ss58 = ss58_encode(key, 42) if key else None
+        except ValueError:
+            ss58 = None
+        caller_key.set(ss58)
+        if request.url.path in QUEUED_PATHS:
+            if not module.batcher.admits(module.caller_priority(ss58)):
+                return queue_full_response("miner queue is full, retry later")
+        return await call_next(request)
+
+    app.middleware("http")(admit)
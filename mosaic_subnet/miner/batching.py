@@ -0,0 +1,186 @@
+import itertools
+import threading
+import time
+from bisect import insort
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+from mosaic_subnet.base.metrics import counter, gauge, histogram
+
+# lower values are served first
+VALIDATOR_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+
+QUEUE_WAIT = histogram(
+    "mosaic_miner_queue_wait_seconds", "Time a sample call waits for its batch to start"
+)
+BATCH_SIZE = histogram(
+    "mosaic_miner_batch_size", "Sample calls per pipeline batch", buckets=(1, 2, 4, 8, 16, 32)
+)
+PIPELINE_TIME = histogram("mosaic_miner_pipeline_seconds", "Pipeline time per batch")
+QUEUE_DEPTH = gauge("mosaic_miner_queue_depth", "Sample calls waiting for a batch")
+REJECTED = counter("mosaic_miner_rejected_total", "Sample calls rejected by admission control")
+
+_sequence = itertools.count()
+
+
+class QueueFull(Exception):
+    """
+    The request queue has no room for this request; retrying later or on
+    another miner is safe.
+    """
+
+
+@dataclass(order=True)
+class SampleRequest:
+    # requests are ordered by priority, then arrival
+    priority: int
+    seq: int = field(default_factory=lambda: next(_sequence))
+    prompt: str = field(default="", compare=False)
+    negative_prompt: str = field(default="", compare=False)
+    steps: int = field(default=1, compare=False)
+    seed: int = field(default=0, compare=False)
+    future: Future = field(default_factory=Future, compare=False)
+    enqueued_at: float = field(default_factory=time.monotonic, compare=False)
+    # called from the worker thread with (step, preview) every preview_every steps
+    preview_every: int = field(default=0, compare=False)
+    on_preview: Optional[Callable[[int, Any], None]] = field(default=None, compare=False)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent `sample` calls and runs them as one batched pipeline call.
+
+    Requests wait in a queue of at most `max_queue_size` entries ordered by
+    priority, then arrival. A single worker thread owns the pipeline: it
+    takes the first request, waits up to `window` seconds for more requests
+    with the same `steps`, up to `max_batch_size`, then hands the batch to
+    `run_batch` and routes every output back to its caller.
+
+    When the queue is full, a request evicts the newest request of a lower
+    priority if there is one and is rejected with `QueueFull` otherwise, so
+    validator calls are never stuck behind a burst of user traffic.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list[SampleRequest]], list[Any]],
+        max_batch_size: int = 4,
+        window: float = 0.05,
+        max_queue_size: int = 32,
+    ) -> None:
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window
+        self.max_queue_size = max(1, max_queue_size)
+        # sorted by (priority, seq)
+        self._pending: list[SampleRequest] = []
+        self._cond = threading.Condition()
+        self.running = 0
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def admits(self, priority: int = DEFAULT_PRIORITY) -> bool:
+        """
+        Whether a request with `priority` would currently be queued. Used to
+        reject callers before doing any other work for them.
+        """
+        pending = self._pending
+        return len(pending) < self.max_queue_size or pending[-1].priority > priority
+
+    def submit(
+        self,
+        prompt: str,
+        negative_prompt: str,
+        steps: int,
+        seed: int,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> Any:
+        request = SampleRequest(
+            priority=priority,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            steps=steps,
+            seed=seed,
+        )
+        self.enqueue(request)
+        return request.future.result()
+
+    def enqueue(self, request: SampleRequest):
+        """
+        Queues `request` without waiting for it; the result is delivered
+        through `request.future`.
+        """
+        priority = request.priority
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                if self._pending[-1].priority <= priority:
+                    REJECTED.inc(priority=str(priority))
+                    raise QueueFull(f"queue full ({self.max_queue_size} pending)")
+                evicted = self._pending.pop()
+                REJECTED.inc(priority=str(evicted.priority))
+                evicted.future.set_exception(QueueFull("evicted by a higher priority request"))
+            insort(self._pending, request)
+            QUEUE_DEPTH.set(len(self._pending))
+            self._cond.notify()
+
+    def _take(self, steps: Optional[int], timeout: Optional[float]) -> Optional[SampleRequest]:
+        """
+        Removes the first queued request, or the first one with `steps` when
+        given, waiting up to `timeout` seconds for it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for index, request in enumerate(self._pending):
+                    if steps is None or request.steps == steps:
+                        del self._pending[index]
+                        QUEUE_DEPTH.set(len(self._pending))
+                        return request
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _collect(self) -> list[SampleRequest]:
+        first = self._take(None, None)
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            request = self._take(first.steps, max(0.0, deadline - time.monotonic()))
+            if request is None:
+                break
+            batch.append(request)
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            logger.debug(f"running batch of {len(batch)}, steps={batch[0].steps}")
+            start = time.monotonic()
+            for request in batch:
+                QUEUE_WAIT.observe(start - request.enqueued_at)
+            BATCH_SIZE.observe(len(batch))
+            self.running = len(batch)
+            try:
+                with PIPELINE_TIME.time():
+                    outputs = self.run_batch(batch)
+            except Exception as e:
+                logger.error(e)
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finally:
+                self.running = 0
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output)
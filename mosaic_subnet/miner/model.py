@@ -1,48 +1,283 @@
 
-from io import BytesIO
-from typing import Optional
-import base64
+from typing import Iterator, Optional
+import queue
+import time
 
 import torch
 from diffusers import AutoPipelineForText2Image
+from loguru import logger
+
+from fastapi import HTTPException
 
 from communex.module.module import Module, endpoint
 
+from mosaic_subnet.miner.admission import RETRY_AFTER, caller_key
+from mosaic_subnet.miner.batching import (
+    DEFAULT_PRIORITY,
+    MicroBatcher,
+    QueueFull,
+    SampleRequest,
+)
+from mosaic_subnet.miner.previews import latents_to_image
+from mosaic_subnet.base.image_codec import (
+    ImageEncoding,
+    encode_image,
+    to_transport,
+    from_transport,
+)
+from mosaic_subnet.base.metrics import counter, histogram
+
+ENCODE_TIME = histogram("mosaic_miner_encode_seconds", "Image encode time per sample call")
+SAMPLES = counter("mosaic_miner_samples_total", "Sample calls served")
+PREVIEW_QUALITY = 70
+
+PRECISIONS = {
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "fp32": torch.float32,
+}
+
+
+def select_device(device: str = "auto") -> torch.device:
+    if device != "auto":
+        return torch.device(device)
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    if torch.backends.mps.is_available():
+        return torch.device("mps")
+    return torch.device("cpu")
+
+
+def select_dtype(device: torch.device, precision: str = "auto") -> torch.dtype:
+    if precision != "auto":
+        return PRECISIONS[precision]
+    # fp16 kernels are slow or missing on most cpus, bf16 only pays off on
+    # cpus with native support, so fp32 is the safe default there
+    if device.type == "cpu":
+        return torch.float32
+    return torch.float16
+
+
 class DiffUsers(Module):
-    def __init__(self, model_name: str = "stabilityai/sdxl-turbo") -> None:
+    def __init__(
+        self,
+        model_name: str = "stabilityai/sdxl-turbo",
+        max_batch_size: int = 4,
+        batch_window: float = 0.05,
+        max_queue_size: int = 32,
+        device: str = "auto",
+        precision: str = "auto",
+        num_threads: Optional[int] = None,
+        attention_slicing: bool = False,
+        channels_last: bool = False,
+        warmup: bool = True,
+    ) -> None:
         super().__init__()
+        start = time.perf_counter()
         self.model_name = model_name
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "mps")
+        self.device = select_device(device)
+        self.dtype = select_dtype(self.device, precision)
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        logger.info(
+            f"loading {model_name} on {self.device} as {self.dtype}, "
+            f"{torch.get_num_threads()} cpu threads"
+        )
+        # the fp16 weights are cast on load, which saves downloading full
+        # precision weights for bf16/fp32. safetensors, preferred when the
+        # repo has them, are memory-mapped instead of unpickled
         self.pipeline = AutoPipelineForText2Image.from_pretrained(
-            model_name, torch_dtype=torch.float16, variant="fp16"
+            model_name, torch_dtype=self.dtype, variant="fp16"
         ).to(self.device)
+        self.pipeline.set_progress_bar_config(disable=True)
+        if attention_slicing:
+            self.pipeline.enable_attention_slicing()
+        elif self.device.type == "cuda":
+            try:
+                self.pipeline.enable_xformers_memory_efficient_attention()
+            except Exception:
+                # diffusers uses torch sdpa by default
+                pass
+        if channels_last:
+            self.pipeline.unet.to(memory_format=torch.channels_last)
+            self.pipeline.vae.to(memory_format=torch.channels_last)
+        self.load_time = time.perf_counter() - start
+        self.warmup_time = None
+        if warmup:
+            self.warmup()
+        self.startup_time = time.perf_counter() - start
+        logger.info(
+            f"model loaded in {self.load_time:.2f}s, "
+            f"ready in {self.startup_time:.2f}s"
+        )
+        self.batcher = MicroBatcher(
+            self.run_batch,
+            max_batch_size=max_batch_size,
+            window=batch_window,
+            max_queue_size=max_queue_size,
+        )
+
+    def warmup(self):
+        """
+        Runs one small generation so the first real request doesn't pay for
+        kernel selection, compilation and allocator growth.
+        """
+        start = time.perf_counter()
+        with torch.inference_mode():
+            self.pipeline(
+                prompt="warmup",
+                num_inference_steps=1,
+                guidance_scale=0.0,
+            )
+        self.warmup_time = time.perf_counter() - start
+        logger.info(f"warmup took {self.warmup_time:.2f}s")
+
+    def run_batch(self, batch: list[SampleRequest]) -> list:
+        # one generator per item keeps every seed deterministic inside a batch
+        generators = [
+            torch.Generator(self.device).manual_seed(request.seed) for request in batch
+        ]
+        callback = None
+        if any(request.on_preview for request in batch):
+            callback = self._preview_callback(batch)
+        with torch.inference_mode():
+            return self.pipeline(
+                prompt=[request.prompt for request in batch],
+                negative_prompt=[request.negative_prompt for request in batch],
+                num_inference_steps=batch[0].steps,
+                generator=generators,
+                guidance_scale=0.0,
+                callback_on_step_end=callback,
+            ).images
+
+    @staticmethod
+    def _preview_callback(batch: list[SampleRequest]):
+        def on_step_end(pipeline, step: int, timestep, callback_kwargs: dict) -> dict:
+            latents = callback_kwargs["latents"]
+            done = step + 1
+            for request, item in zip(batch, latents):
+                if (
+                    request.on_preview is None
+                    or done % request.preview_every
+                    or done >= request.steps
+                ):
+                    continue
+                try:
+                    request.on_preview(done, latents_to_image(item))
+                except Exception as e:
+                    logger.error(e)
+            return callback_kwargs
+
+        return on_step_end
+
+    def caller_priority(self, key: Optional[str]) -> int:
+        """
+        Queue priority of a caller, lower is served first.
+        """
+        return DEFAULT_PRIORITY
 
     @endpoint
     def sample(
         self, prompt: str, steps: int = 50, negative_prompt: str = "", seed:
-    Optional[int]=None) -> str:
-        generator = torch.Generator(self.device)
+    Optional[int]=None, encoding: ImageEncoding = ImageEncoding.PNG,
+        quality: Optional[int] = None) -> str:
+        # checked before the request takes a batch slot
+        encoding = ImageEncoding(encoding)
+        if seed is None:
+            seed = torch.Generator(self.device).seed()
+        try:
+            image = self.batcher.submit(
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                steps=steps,
+                seed=seed,
+                priority=self.caller_priority(caller_key.get()),
+            )
+        except QueueFull as e:
+            raise HTTPException(
+                status_code=503, detail=str(e), headers={"Retry-After": RETRY_AFTER}
+            )
+        with ENCODE_TIME.time():
+            result = to_transport(encode_image(image, encoding, quality))
+        SAMPLES.inc()
+        return result
+
+    def sample_stream(
+        self,
+        prompt: str,
+        steps: int = 50,
+        negative_prompt: str = "",
+        seed: Optional[int] = None,
+        encoding: ImageEncoding = ImageEncoding.PNG,
+        quality: Optional[int] = None,
+        preview_every: int = 4,
+        priority: int = DEFAULT_PRIORITY,
+    ) -> Iterator[dict]:
+        """
+        Queues one sample and returns an iterator of events: a "preview" with
+        a small jpeg every `preview_every` steps, then the final "image", or
+        an "error". Raises `QueueFull` right away instead of streaming, and
+        `ValueError` for an unknown encoding.
+        """
+        encoding = ImageEncoding(encoding)
         if seed is None:
-            seed = generator.seed()
-        generator = generator.manual_seed(seed)
-        image = self.pipeline(
+            seed = torch.Generator(self.device).seed()
+        events: queue.Queue = queue.Queue()
+        request = SampleRequest(
+            priority=priority,
             prompt=prompt,
             negative_prompt=negative_prompt,
-            num_inference_steps=steps,
-            generator=generator,
-            guidance_scale=0.0
-        ).images[0]
-        buf = BytesIO()
-        image.save(buf, format="png")
-        buf.seek(0)
-        return base64.b64encode(buf.read()).decode()
+            steps=steps,
+            seed=seed,
+            preview_every=max(1, preview_every),
+            on_preview=lambda step, image: events.put((step, image)),
+        )
+        request.future.add_done_callback(lambda _: events.put(None))
+        self.batcher.enqueue(request)
+        return self._stream_events(request, events, encoding, quality)
+
+    def _stream_events(
+        self,
+        request: SampleRequest,
+        events: queue.Queue,
+        encoding: ImageEncoding,
+        quality: Optional[int],
+    ) -> Iterator[dict]:
+        while (event := events.get()) is not None:
+            step, image = event
+            preview = encode_image(image, ImageEncoding.JPEG, PREVIEW_QUALITY)
+            yield {
+                "event": "preview",
+                "step": step,
+                "steps": request.steps,
+                "image": to_transport(preview),
+            }
+        try:
+            image = request.future.result()
+        except Exception as e:
+            yield {"event": "error", "message": str(e)}
+            return
+        with ENCODE_TIME.time():
+            result = to_transport(encode_image(image, encoding, quality))
+        SAMPLES.inc()
+        yield {"event": "image", "image": result}
 
     @endpoint
     def get_metadata(self) -> dict:
-        return {"model": self.model_name}
+        return {
+            "model": self.model_name,
+            "device": self.device.type,
+            "dtype": str(self.dtype).removeprefix("torch."),
+            "load_time": self.load_time,
+            "warmup_time": self.warmup_time,
+            "startup_time": self.startup_time,
+            "queue_depth": self.batcher.queue_depth,
+            "max_queue_size": self.batcher.max_queue_size,
+            "running": self.batcher.running,
+        }
 
 if __name__ == "__main__":
     d = DiffUsers()
     out = d.sample(prompt="cat, jumping")
     with open("a.png", "wb") as f:
-        f.write(out)
+        f.write(from_transport(out))
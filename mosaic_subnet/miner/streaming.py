@@ -0,0 +1,72 @@
+import json
+from typing import TYPE_CHECKING, Optional
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from substrateinterface import Keypair
+
+from communex.key import check_ss58_address
+from communex.module.server import build_input_handler_route_class
+
+from mosaic_subnet.base import SampleInput
+from mosaic_subnet.miner.admission import caller_key, queue_full_response
+from mosaic_subnet.miner.batching import QueueFull
+
+if TYPE_CHECKING:
+    from mosaic_subnet.miner.model import DiffUsers
+
+NDJSON = "application/x-ndjson"
+
+
+class StreamInput(SampleInput):
+    # steps between two previews
+    preview_every: int = 4
+
+
+class StreamBody(BaseModel):
+    params: StreamInput
+
+
+def add_stream_route(
+    app: FastAPI,
+    module: "DiffUsers",
+    key: Keypair,
+    subnets_whitelist: Optional[list[int]] = None,
+    max_request_staleness: int = 120,
+):
+    """
+    Serves `DiffUsers.sample_stream` as newline-delimited JSON events on
+    /method/sample_stream. communex endpoints can only return one JSON
+    document, so the route is added next to them with the same signature,
+    staleness and registration checks.
+    """
+    router = APIRouter(
+        route_class=build_input_handler_route_class(
+            subnets_whitelist,
+            check_ss58_address(key.ss58_address),
+            max_request_staleness,
+        )
+    )
+
+    @router.post("/method/sample_stream")
+    def sample_stream(body: StreamBody):
+        params = body.params
+        try:
+            events = module.sample_stream(
+                prompt=params.prompt,
+                steps=params.steps,
+                negative_prompt=params.negative_prompt,
+                seed=params.seed,
+                encoding=params.encoding,
+                quality=params.quality,
+                preview_every=params.preview_every,
+                priority=module.caller_priority(caller_key.get()),
+            )
+        except QueueFull as e:
+            return queue_full_response(str(e))
+        return StreamingResponse(
+            (json.dumps(event) + "\n" for event in events), media_type=NDJSON
+        )
+
+    app.include_router(router)
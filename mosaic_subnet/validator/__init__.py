@@ -1,9 +1,7 @@
 import time
 import asyncio
-import concurrent.futures
-import time
-from functools import partial
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Optional
 
 from loguru import logger
 from PIL import UnidentifiedImageError
@@ -20,106 +18,253 @@ from communex.client import CommuneClient
 from communex.compat.key import classic_load_key
 
 from mosaic_subnet.validator._config import ValidatorSettings
-from mosaic_subnet.validator.model import CLIP
 from mosaic_subnet.base.utils import get_netuid
 from mosaic_subnet.base import SampleInput, BaseValidator
+from mosaic_subnet.base.chain import ChainSnapshot
+from mosaic_subnet.base.lazy import Lazy
+from mosaic_subnet.base.pool import MinerConnectionPool
+from mosaic_subnet.base.query import MinerQueryEngine
 from mosaic_subnet.validator.dataset import ValidationDataset
-from mosaic_subnet.validator.sigmoid import threshold_sigmoid_reward_distribution
+from mosaic_subnet.validator.ledger import ScoreLedger
+from mosaic_subnet.validator.pipeline import ValidationPipeline
+from mosaic_subnet.validator.scheduler import MinerScheduler
+from mosaic_subnet.validator.weights import WeightSubmitter
+from mosaic_subnet.base.metrics import counter, histogram, start_metrics_server
+
+QUERY_TIME = histogram("mosaic_validator_query_seconds", "Time to query all miners for a prompt")
+MINER_RESPONSES = counter("mosaic_validator_miner_responses_total", "Miner answers by outcome")
+SIGMOID_TIME = histogram(
+    "mosaic_validator_sigmoid_seconds", "Sigmoid thresholding and weight normalization time"
+)
+VOTE_TIME = histogram("mosaic_validator_vote_seconds", "Weight submission time")
+VOTE_ERRORS = counter("mosaic_validator_vote_errors_total", "Failed weight submissions")
+ROUNDS = counter("mosaic_validator_rounds_total", "Validation rounds started")
+NSFW_UNAVAILABLE = counter(
+    "mosaic_validator_nsfw_unavailable_total",
+    "Chunks scored unscreened because the NSFW checker failed to load",
+)
+
+if TYPE_CHECKING:
+    from mosaic_subnet.validator.model import CLIP, NSFWChecker
 
 
 class Validator(BaseValidator, Module):
-    def __init__(self, key: Keypair, settings: ValidatorSettings | None = None) -> None:
+    def __init__(
+        self,
+        key: Keypair,
+        settings: ValidatorSettings | None = None,
+        c_client: CommuneClient | None = None,
+    ) -> None:
         super().__init__()
         self.settings = settings or ValidatorSettings()
         self.key = key
-        self.c_client = CommuneClient(
+        self.c_client = c_client or CommuneClient(
             get_node_url(use_testnet=self.settings.use_testnet)
         )
-        self.netuid = get_netuid(self.c_client)
-        self.model = CLIP()
-        self.dataset = ValidationDataset()
+        self.chain = ChainSnapshot(
+            self.c_client,
+            netuid=self.settings.netuid,
+            modules_ttl=self.settings.chain_modules_ttl,
+            weights_ttl=self.settings.chain_weights_ttl,
+        )
+        self.chain.start()
+        self.netuid = self.chain.netuid
+        # models and prompts load on first use, so the chain connection and
+        # the first query round don't wait for torch
+        self._model = Lazy(self._load_model, "CLIP")
+        # a failed download is retried every few minutes, not every chunk
+        self._nsfw = Lazy(self._load_nsfw, "NSFW checker", retry_interval=300)
+        self._dataset = Lazy(self._load_dataset, "prompt dataset")
         self.call_timeout = self.settings.call_timeout
+        self.query_engine = MinerQueryEngine(
+            key=self.key,
+            call_timeout=self.call_timeout,
+            max_concurrency=self.settings.query_concurrency,
+            round_timeout=self.settings.round_timeout,
+            pool=MinerConnectionPool(
+                self.key,
+                limit_per_host=self.settings.pool_limit_per_host,
+                idle_timeout=self.settings.pool_idle_timeout,
+            ),
+        )
+        self.ledger = ScoreLedger(alpha=self.settings.score_ema_alpha)
+        self.scheduler = MinerScheduler(
+            budget=self.settings.query_budget,
+            # miners not scored for score_max_age rounds lose their weight
+            rotation_rounds=min(
+                self.settings.query_rotation_rounds, self.settings.score_max_age
+            ),
+        )
+        self.weight_submitter = WeightSubmitter(
+            self.set_weights,
+            interval=self.settings.vote_interval or self.settings.iteration_interval,
+            min_change=self.settings.vote_min_change,
+            retry_delay=self.settings.vote_retry_delay,
+            max_backoff=self.settings.vote_max_backoff,
+        )
+        self.weight_submitter.start()
+        self.round_timings: dict[str, float] = {}
 
-    def calculate_score(self, img: bytes, prompt: str):
-        try:
-            return self.model.get_similarity(img, prompt)
-        except Exception:
-            return 0
+    def _load_model(self) -> "CLIP":
+        from mosaic_subnet.validator.model import CLIP
+        from mosaic_subnet.validator.embedding_cache import TextEmbeddingCache
 
-    async def validate_step(self):
-        score_dict = dict()
-        modules_info = self.get_queryable_miners()
+        text_cache = None
+        if self.settings.text_cache_max_bytes > 0:
+            text_cache = TextEmbeddingCache(
+                max_bytes=self.settings.text_cache_max_bytes,
+                path=self.settings.text_cache_path,
+            )
+        return CLIP(
+            batch_size=self.settings.clip_batch_size,
+            text_cache=text_cache,
+            preprocess_workers=self.settings.preprocess_workers,
+            max_image_bytes=self.settings.max_image_bytes,
+            max_image_pixels=self.settings.max_image_pixels,
+        )
+
+    def _load_nsfw(self) -> "Optional[NSFWChecker]":
+        if not self.settings.nsfw_screening:
+            return None
+        from mosaic_subnet.validator.model import NSFWChecker
+
+        return NSFWChecker(
+            model_name=self.settings.nsfw_model,
+            batch_size=self.settings.nsfw_batch_size,
+            threshold=self.settings.nsfw_threshold,
+        )
+
+    def _load_dataset(self) -> ValidationDataset:
+        return ValidationDataset(
+            path=self.settings.prompt_store_path,
+            source=self.settings.prompt_source,
+            subset_size=self.settings.prompt_subset_size,
+        )
+
+    @property
+    def model(self) -> "CLIP":
+        return self._model.get()
 
-        input = self.get_validate_input()
-        logger.debug("input:", input)
-        get_miner_generation = partial(self.get_miner_generation, input=input)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-            it = executor.map(get_miner_generation, modules_info.values())
-            miner_answers = [*it]
+    @model.setter
+    def model(self, model):
+        self._model.set(model)
 
-        for uid, miner_response in zip(modules_info.keys(), miner_answers):
-            miner_answer = miner_response
+    @property
+    def nsfw(self) -> "Optional[NSFWChecker]":
+        return self._nsfw.get()
+
+    @property
+    def dataset(self) -> ValidationDataset:
+        return self._dataset.get()
+
+    def nsfw_checker(self) -> "Optional[NSFWChecker]":
+        """
+        The NSFW checker, or None when screening is off or the checker failed
+        to load; images are then scored unscreened.
+        """
+        try:
+            return self.nsfw
+        except Exception as e:
+            NSFW_UNAVAILABLE.inc()
+            logger.error(f"nsfw checker unavailable, scoring unscreened: {e}")
+            return None
+
+    def calculate_scores(self, text_embeds, imgs: list[bytes]) -> list[float]:
+        nsfw = self.nsfw_checker()
+        try:
+            return self.model.score_images(text_embeds, imgs, nsfw=nsfw)
+        except Exception as e:
+            logger.error(e)
+            return [0] * len(imgs)
+
+    async def query_chunks(
+        self, modules_info: dict, input: SampleInput
+    ) -> AsyncIterator[tuple[list[int], list[bytes]]]:
+        """
+        Queries miners and yields their answers in chunks of clip_batch_size
+        as soon as enough of them have answered. Miners that don't answer are
+        recorded in the ledger with a score of 0.
+        """
+        chunk_uids, chunk_imgs = [], []
+        missed = []
+        start = time.perf_counter()
+        async for uid, miner_answer in self.query_engine.stream(modules_info, input):
             if not miner_answer:
                 logger.debug(f"Skipping miner {uid} that didn't answer")
+                missed.append(uid)
                 continue
-            score = self.calculate_score(miner_answer, input.prompt)
-            score_dict[uid] = score
-
-        if not score_dict:
-            logger.info("score_dict empty, skip set weights")
-            return
-        logger.debug("original scores:", score_dict)
-        adjsuted_to_sigmoid = threshold_sigmoid_reward_distribution(
-            score_dict=score_dict
-        )
-        logger.debug("sigmoid scores:", adjsuted_to_sigmoid)
-        # Create a new dictionary to store the weighted scores
-        weighted_scores: dict[int, int] = {}
-
-        # Calculate the sum of all inverted scores
-        scores = sum(adjsuted_to_sigmoid.values())
+            chunk_uids.append(uid)
+            chunk_imgs.append(miner_answer)
+            if len(chunk_imgs) >= self.settings.clip_batch_size:
+                yield chunk_uids, chunk_imgs
+                chunk_uids, chunk_imgs = [], []
+        QUERY_TIME.observe(time.perf_counter() - start)
+        MINER_RESPONSES.inc(len(modules_info) - len(missed), outcome="answered")
+        MINER_RESPONSES.inc(len(missed), outcome="missed")
+        if chunk_imgs:
+            yield chunk_uids, chunk_imgs
+        self.ledger.update(missed, [0.0] * len(missed))
 
-        # Iterate over the items in the score_dict
-        for uid, score in adjsuted_to_sigmoid.items():
-            # Calculate the normalized weight as an integer
-            weight = int(score * 1000 / scores)
+    def start_round(self) -> tuple[int, dict, list[SampleInput]]:
+        round_id = self.ledger.next_round()
+        ROUNDS.inc()
+        modules_info = self.get_queryable_miners()
+        self.ledger.sync_keys(self.chain.state.keys)
+        modules_info = self.scheduler.select(modules_info, self.ledger)
+        inputs = [self.get_validate_input() for _ in range(self.settings.prompts_per_round)]
+        logger.debug("inputs:", inputs)
+        return round_id, modules_info, inputs
 
-            # Add the weighted score to the new dictionary
-            weighted_scores[uid] = weight
+    async def validate_step(self):
+        """
+        Runs one round through the stages of `ValidationPipeline`.
+        """
+        pipeline = ValidationPipeline(self, queue_size=self.settings.pipeline_queue_size)
+        await pipeline.run_round()
 
-        # filter out 0 weights
-        weighted_scores = {k: v for k, v in weighted_scores.items() if v != 0}
+    def get_weights(self) -> dict[int, int]:
+        with SIGMOID_TIME.time():
+            uids, weights = self.ledger.weights(max_age=self.settings.score_max_age)
+        weighted_scores = dict(zip(uids.tolist(), weights.tolist()))
         logger.debug("weighted scores:", weighted_scores)
         if not weighted_scores:
             logger.info("weighted_scores empty, skip set weights")
-            return
+        return weighted_scores
+
+    def set_weights(self, weighted_scores: dict[int, int]):
+        """
+        Votes on chain, blocking; raises when the vote fails. Rounds hand
+        their weights to `weight_submitter` instead.
+        """
+        uids = list(weighted_scores.keys())
+        weights = list(weighted_scores.values())
+        logger.info("Setting weights for {count} uids", count=len(uids))
+        logger.debug(f"Setting weights for the following uids: {uids}")
         try:
-            uids = list(weighted_scores.keys())
-            weights = list(weighted_scores.values())
-            logger.info("Setting weights for {count} uids", count=len(uids))
-            logger.debug(f"Setting weights for the following uids: {uids}")
-            self.c_client.vote(
-                key=self.key, uids=uids, weights=weights, netuid=self.netuid
-            )
-        except Exception as e:
-            logger.error(e)
+            with VOTE_TIME.time():
+                self.c_client.vote(
+                    key=self.key, uids=uids, weights=weights, netuid=self.netuid
+                )
+        except Exception:
+            VOTE_ERRORS.inc()
+            raise
 
     def get_validate_input(self):
         return SampleInput(
             prompt=self.dataset.random_prompt(),
             steps=2,
+            encoding=self.settings.image_encoding,
+            quality=self.settings.image_quality,
         )
 
     def validation_loop(self) -> None:
-        settings = self.settings
-        while True:
-            start_time = time.time()
-            asyncio.run(self.validate_step())
-            elapsed = time.time() - start_time
-            if elapsed < settings.iteration_interval:
-                sleep_time = settings.iteration_interval - elapsed
-                logger.info(f"Sleeping for {sleep_time}")
-                time.sleep(sleep_time)
+        if self.settings.metrics_port:
+            start_metrics_server(self.settings.metrics_port)
+        # loads the models while the first round is queried
+        self._model.preload()
+        self._nsfw.preload()
+        pipeline = ValidationPipeline(self, queue_size=self.settings.pipeline_queue_size)
+        asyncio.run(pipeline.run())
 
 
 if __name__ == "__main__":
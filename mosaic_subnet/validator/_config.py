@@ -1,6 +1,63 @@
 from mosaic_subnet.base.config import MosaicBaseSettings
-from typing import List
+from mosaic_subnet.base.image_codec import ImageEncoding
+from typing import List, Optional
 
 
 class ValidatorSettings(MosaicBaseSettings):
     iteration_interval: int = 60
+    # min seconds between weight submissions, defaults to iteration_interval
+    vote_interval: Optional[float] = None
+    # weights that moved less than this since the last vote aren't
+    # submitted, as the total variation distance of the normalized vectors
+    vote_min_change: float = 0.01
+    # first retry delay of a failed vote, doubled up to vote_max_backoff
+    vote_retry_delay: float = 5
+    vote_max_backoff: float = 300
+    # serves prometheus metrics on this port when set
+    metrics_port: Optional[int] = None
+    # max scoring chunks buffered between the query and scoring stages
+    pipeline_queue_size: int = 8
+    # max number of miners queried at the same time
+    query_concurrency: int = 64
+    # max miners queried per round, all of them when unset; see
+    # validator/scheduler.py for how they are picked
+    query_budget: Optional[int] = None
+    # every miner is queried at least once in this many rounds, capped by
+    # score_max_age; raises query_budget when needed
+    query_rotation_rounds: int = 5
+    # deadline for a whole query round, defaults to call_timeout
+    round_timeout: Optional[float] = None
+    # number of images per CLIP vision forward pass
+    clip_batch_size: int = 16
+    # image decode threads, defaults to the number of cores
+    preprocess_workers: Optional[int] = None
+    # miner images above these limits score 0 without being decoded
+    max_image_bytes: int = 8 * 1024 * 1024
+    max_image_pixels: int = 4096 * 4096
+    # encoding miners are asked to answer in. lossless webp is much smaller
+    # than png at the fast compress level miners use by default, at the cost
+    # of more cpu per image on the miner. image_quality as in SampleInput
+    image_encoding: ImageEncoding = ImageEncoding.WEBP
+    image_quality: Optional[int] = None
+    # images flagged as nsfw score 0
+    nsfw_screening: bool = True
+    nsfw_model: str = "Falconsai/nsfw_image_detection"
+    nsfw_batch_size: int = 16
+    # nsfw probability above which an image is flagged
+    nsfw_threshold: float = 0.8
+    # prompts every miner is scored on per round
+    prompts_per_round: int = 1
+    # weight of the newest score in each miner's score EMA
+    score_ema_alpha: float = 0.3
+    # rounds after which a miner that wasn't scored gets no weight
+    score_max_age: int = 10
+    # memory bound of the prompt text-embedding cache, 0 disables it
+    text_cache_max_bytes: int = 64 * 1024 * 1024
+    # directory with precomputed text embeddings, see validator/embedding_cache.py
+    text_cache_path: Optional[str] = None
+    # prompt store file, built from prompt_source when missing. delete it
+    # to rebuild after changing the source or the subset size
+    prompt_store_path: str = "~/.cache/mosaic/prompts.bin"
+    # huggingface dataset name or local .txt/.parquet file
+    prompt_source: str = "FredZhang7/stable-diffusion-prompts-2.47M"
+    prompt_subset_size: Optional[int] = None
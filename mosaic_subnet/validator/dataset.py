@@ -1,14 +1,36 @@
-from datasets import load_dataset
-from random import randint
+import os
+import time
+from random import randrange
+from typing import Optional
+
+from loguru import logger
+
+from mosaic_subnet.validator.prompt_store import PromptStore, build_prompt_store
+
+DEFAULT_SOURCE = "FredZhang7/stable-diffusion-prompts-2.47M"
+DEFAULT_STORE_PATH = "~/.cache/mosaic/prompts.bin"
 
 
 class ValidationDataset:
-    def __init__(self) -> None:
-        self.dataset = load_dataset("FredZhang7/stable-diffusion-prompts-2.47M")
+    def __init__(
+        self,
+        path: str = DEFAULT_STORE_PATH,
+        source: str = DEFAULT_SOURCE,
+        subset_size: Optional[int] = None,
+    ) -> None:
+        path = os.path.expanduser(path)
+        if not os.path.exists(path):
+            # built once, later starts only map the file
+            logger.info(f"building prompt store from {source}")
+            build_prompt_store(path, source, subset_size=subset_size)
+        start = time.time()
+        self.dataset = PromptStore(path)
+        logger.info(
+            f"loaded {len(self.dataset)} prompts in {time.time() - start:.3f}s"
+        )
 
     def random_prompt(self) -> str:
-        index = randint(0, len(self.dataset["train"]))
-        return self.dataset["train"][index]["text"]
+        return self.dataset[randrange(len(self.dataset))]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+from loguru import logger
+
+EMBEDDINGS_FILE = "embeddings.npy"
+INDEX_FILE = "index.json"
+
+
+def cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha1(f"{model_name}\n{prompt}".encode()).hexdigest()
+
+
+class TextEmbeddingCache:
+    """
+    LRU cache of normalized text embeddings keyed by (model name, prompt).
+
+    The in-memory tier is bounded by `max_bytes`. An optional read-only disk
+    tier, built offline with `build_disk_cache`, is memory-mapped and checked
+    on memory misses; rows found there are promoted into memory.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_embeddings: Optional[np.ndarray] = None
+        self._disk_index: dict[str, int] = {}
+        if path:
+            self.load_disk(path)
+
+    def load_disk(self, path: str):
+        index_path = os.path.join(path, INDEX_FILE)
+        embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(embeddings_path)):
+            logger.warning(f"no text embedding cache found at {path}")
+            return
+        with open(index_path) as f:
+            self._disk_index = json.load(f)
+        self._disk_embeddings = np.load(embeddings_path, mmap_mode="r")
+        logger.info(f"loaded {len(self._disk_index)} text embeddings from {path}")
+
+    def get(self, model_name: str, prompt: str) -> Optional[np.ndarray]:
+        key = cache_key(model_name, prompt)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            row = self._disk_index.get(key)
+            if row is not None and self._disk_embeddings is not None:
+                value = np.array(self._disk_embeddings[row])
+                self._put(key, value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, prompt: str, value: np.ndarray):
+        with self._lock:
+            self._put(cache_key(model_name, prompt), value)
+
+    def _put(self, key: str, value: np.ndarray):
+        if value.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self._entries[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "disk_entries": len(self._disk_index),
+        }
+
+
+def build_disk_cache(model, prompts: Iterable[str], path: str):
+    """
+    Precomputes the text embeddings of `prompts` with a `CLIP` model and
+    writes them to `path` in the layout read by `TextEmbeddingCache`.
+    """
+    os.makedirs(path, exist_ok=True)
+    index: dict[str, int] = {}
+    rows: list[np.ndarray] = []
+    for prompt in prompts:
+        key = cache_key(model.model_name, prompt)
+        if key in index:
+            continue
+        index[key] = len(rows)
+        rows.append(model.encode_text(prompt).squeeze(0).float().cpu().numpy())
+    np.save(os.path.join(path, EMBEDDINGS_FILE), np.stack(rows))
+    with open(os.path.join(path, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+    logger.info(f"saved {len(rows)} text embeddings to {path}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    from mosaic_subnet.validator.model import CLIP
+
+    prompts_file, output = sys.argv[1], sys.argv[2]
+    with open(prompts_file) as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    build_disk_cache(CLIP(), prompts, output)
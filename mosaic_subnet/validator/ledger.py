@@ -0,0 +1,113 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+from mosaic_subnet.validator.sigmoid import normalize_weights, threshold_sigmoid_rewards
+
+
+class ScoreLedger:
+    """
+    Per-uid score history stored in NumPy arrays indexed by uid.
+
+    Holds an EMA of the scores and of their variance, the number of samples
+    and the round each uid was last scored in. Several prompts can be scored
+    into the same round, and weights are computed over every uid seen in the
+    last `max_age` rounds without any per-uid Python work.
+
+    Not thread-safe: `update` writes several arrays one after the other and
+    `_ensure` rebinds them, so the validator only uses it from its event loop.
+    """
+
+    def __init__(self, alpha: float = 0.3, size: int = 256) -> None:
+        self.alpha = alpha
+        self.round = 0
+        self.ema = np.zeros(size, dtype=np.float64)
+        self.var = np.zeros(size, dtype=np.float64)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.last_seen = np.full(size, -1, dtype=np.int64)
+        self.keys: dict[int, str] = {}
+
+    def _ensure(self, max_uid: int):
+        size = len(self.ema)
+        if max_uid < size:
+            return
+        new_size = max(size * 2, max_uid + 1)
+        self.ema = np.resize(self.ema, new_size)
+        self.var = np.resize(self.var, new_size)
+        self.counts = np.resize(self.counts, new_size)
+        self.last_seen = np.resize(self.last_seen, new_size)
+        self.ema[size:] = 0
+        self.var[size:] = 0
+        self.counts[size:] = 0
+        self.last_seen[size:] = -1
+
+    def next_round(self) -> int:
+        self.round += 1
+        return self.round
+
+    def update(
+        self,
+        uids: Sequence[int],
+        scores: Sequence[float],
+        round_id: Optional[int] = None,
+    ):
+        if len(uids) == 0:
+            return
+        uids = np.asarray(uids, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        self._ensure(int(uids.max()))
+        # uids without history start at their first score
+        first = self.counts[uids] == 0
+        ema = self.ema[uids]
+        diff = scores - ema
+        self.ema[uids] = np.where(first, scores, ema + self.alpha * diff)
+        # exponentially weighted variance, matching the EMA
+        var = (1 - self.alpha) * (self.var[uids] + self.alpha * diff**2)
+        self.var[uids] = np.where(first, 0, var)
+        self.counts[uids] += 1
+        self.last_seen[uids] = self.round if round_id is None else round_id
+
+    def reset(self, uids: Sequence[int]):
+        uids = np.asarray(uids, dtype=np.int64)
+        uids = uids[uids < len(self.ema)]
+        self.ema[uids] = 0
+        self.var[uids] = 0
+        self.counts[uids] = 0
+        self.last_seen[uids] = -1
+
+    def sync_keys(self, keys: dict[int, str]):
+        """
+        Drops the history of uids that were taken over by another key.
+        """
+        changed = [uid for uid, key in self.keys.items() if keys.get(uid) != key]
+        if changed:
+            self.reset(changed)
+        self.keys = dict(keys)
+
+    def sampling_stats(self, uids: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the sample counts, the rounds since last scored (`round + 1`
+        for uids never scored) and the score standard deviations of `uids`.
+        """
+        if len(uids):
+            self._ensure(int(uids.max()))
+        last_seen = self.last_seen[uids]
+        age = np.where(last_seen >= 0, self.round - last_seen, self.round + 1)
+        return self.counts[uids], age, np.sqrt(self.var[uids])
+
+    def active_uids(self, max_age: int) -> np.ndarray:
+        seen = self.last_seen >= 0
+        return np.flatnonzero(seen & (self.last_seen >= self.round - max_age))
+
+    def weights(self, max_age: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the uids and the non-zero integer weights (summing to at most
+        1000) of every uid scored in the last `max_age` rounds.
+        """
+        uids = self.active_uids(max_age)
+        if len(uids) == 0:
+            return uids, np.zeros(0, dtype=np.int64)
+        rewards = threshold_sigmoid_rewards(self.ema[uids])
+        weights = normalize_weights(rewards)
+        nonzero = weights != 0
+        return uids[nonzero], weights[nonzero]
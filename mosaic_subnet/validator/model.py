@@ -1,56 +1,264 @@
 from io import BytesIO
+from typing import Optional
 
 import torch
+import torch.nn.functional as F
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-from transformers import pipeline
+from transformers import (
+    AutoImageProcessor,
+    AutoModelForImageClassification,
+    CLIPModel,
+    CLIPProcessor,
+)
 from loguru import logger
 
 from communex.module.module import Module, endpoint
 
+from mosaic_subnet.validator.embedding_cache import TextEmbeddingCache
+from mosaic_subnet.validator.preprocess import ImagePreprocessor
+from mosaic_subnet.base.lazy import log_duration
+from mosaic_subnet.base.metrics import counter, histogram
+
+TEXT_ENCODE_TIME = histogram(
+    "mosaic_validator_text_encode_seconds", "CLIP text encoder time per prompt"
+)
+DECODE_TIME = histogram(
+    "mosaic_validator_decode_seconds", "Image decode and preprocess time per scoring call"
+)
+CLIP_TIME = histogram("mosaic_validator_clip_seconds", "CLIP vision forward time per chunk")
+NSFW_TIME = histogram("mosaic_validator_nsfw_seconds", "NSFW screening time per scoring call")
+NSFW_FLAGGED = counter("mosaic_nsfw_flagged_total", "Images flagged by NSFW screening")
+NSFW_ERRORS = counter(
+    "mosaic_validator_nsfw_errors_total", "Failed NSFW screenings, scored unscreened"
+)
+
 
 class CLIP(Module):
-    def __init__(self, model_name: str = "openai/clip-vit-base-patch32") -> None:
+    def __init__(
+        self,
+        model_name: str = "openai/clip-vit-base-patch32",
+        batch_size: int = 16,
+        text_cache: TextEmbeddingCache | None = None,
+        preprocess_workers: Optional[int] = None,
+        max_image_bytes: int = 8 * 1024 * 1024,
+        max_image_pixels: int = 4096 * 4096,
+    ) -> None:
         super().__init__()
         self.model_name = model_name
+        self.batch_size = batch_size
+        self.text_cache = text_cache
         logger.info(self.model_name)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
-        self.processor = CLIPProcessor.from_pretrained(model_name)
+        with log_duration(f"loading {model_name}"):
+            # safetensors, preferred when the repo has them, are memory-mapped
+            # and copied straight into the model instead of into randomly
+            # initialized weights
+            self.model = CLIPModel.from_pretrained(
+                model_name, low_cpu_mem_usage=True
+            ).to(self.device)
+            self.model.eval()
+            self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.preprocessor = ImagePreprocessor.from_processor(
+            self.processor,
+            max_bytes=max_image_bytes,
+            max_pixels=max_image_pixels,
+            workers=preprocess_workers,
+            pin_memory=self.device.type == "cuda",
+        )
 
-    def get_similarity(self, file: bytes, prompt: str) -> float:
-        image = Image.open(BytesIO(file))
+    def encode_text(self, prompt: str) -> torch.Tensor:
+        """
+        Returns the normalized text embedding of `prompt`, shape (1, dim).
+        """
+        if self.text_cache is None:
+            with TEXT_ENCODE_TIME.time():
+                return self._encode_text(prompt)
+        cached = self.text_cache.get(self.model_name, prompt)
+        if cached is not None:
+            return torch.from_numpy(cached).unsqueeze(0).to(self.device)
+        with TEXT_ENCODE_TIME.time():
+            text_embeds = self._encode_text(prompt)
+        self.text_cache.put(
+            self.model_name, prompt, text_embeds.squeeze(0).float().cpu().numpy()
+        )
+        return text_embeds
+
+    @torch.inference_mode()
+    def _encode_text(self, prompt: str) -> torch.Tensor:
         inputs = self.processor(
-            text=prompt, images=image, return_tensors="pt", padding=True
+            text=prompt, return_tensors="pt", padding=True, truncation=True
+        )
+        text_embeds = self.model.get_text_features(
+            input_ids=inputs["input_ids"].to(self.device),
+            attention_mask=inputs["attention_mask"].to(self.device),
         )
-        inputs["input_ids"] = inputs["input_ids"].to(self.device)
-        inputs["attention_mask"] = inputs["attention_mask"].to(self.device)
-        inputs["pixel_values"] = inputs["pixel_values"].to(self.device)
-        outputs = self.model(**inputs)
-        score = outputs.logits_per_image.sum().tolist() / 100
-        return score
+        return text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+
+    @torch.inference_mode()
+    def score_images(
+        self,
+        text_embeds: torch.Tensor,
+        files: list[bytes],
+        batch_size: int | None = None,
+        nsfw: "NSFWChecker | None" = None,
+    ) -> list[float]:
+        """
+        Scores every image in `files` against an embedding from `encode_text`.
+        Images are decoded in parallel by `preprocessor` and go through the
+        vision tower in chunks of `batch_size`; images that are rejected,
+        flagged by `nsfw` or can't be scored get a score of 0.
+        """
+        batch_size = batch_size or self.batch_size
+        scores = [0.0] * len(files)
+        text_embeds = text_embeds.to(self.device)
+        logit_scale = self.model.logit_scale.exp().item()
+        with self.preprocessor.lock:
+            with DECODE_TIME.time():
+                pixels, positions = self.preprocessor(files)
+            if nsfw is not None and positions:
+                # screened on the pixels decoded for CLIP, flagged images
+                # skip the vision tower
+                try:
+                    flagged = nsfw.screen_pixels(
+                        pixels, self.preprocessor.mean, self.preprocessor.std
+                    )
+                except Exception as e:
+                    # a broken screening pass must not zero the whole chunk
+                    NSFW_ERRORS.inc()
+                    logger.error(f"nsfw screening failed, scoring unscreened: {e}")
+                    flagged = [False] * len(positions)
+                keep = [j for j, is_nsfw in enumerate(flagged) if not is_nsfw]
+                if len(keep) < len(positions):
+                    pixels = pixels[keep]
+                    positions = [positions[j] for j in keep]
+            for start in range(0, len(positions), batch_size):
+                try:
+                    with CLIP_TIME.time():
+                        pixel_values = pixels[start : start + batch_size].to(
+                            self.device, non_blocking=True
+                        )
+                        image_embeds = self.model.get_image_features(
+                            pixel_values=pixel_values
+                        )
+                        image_embeds = image_embeds / image_embeds.norm(
+                            p=2, dim=-1, keepdim=True
+                        )
+                        logits = (image_embeds @ text_embeds.T).squeeze(-1) * logit_scale
+                except Exception as e:
+                    logger.error(e)
+                    continue
+                for i, logit in zip(positions[start : start + batch_size], logits.tolist()):
+                    scores[i] = logit / 100
+        return scores
+
+    def get_similarities(
+        self, prompt: str, files: list[bytes], batch_size: int | None = None
+    ) -> list[float]:
+        return self.score_images(self.encode_text(prompt), files, batch_size)
+
+    def get_similarity(self, file: bytes, prompt: str) -> float:
+        return self.get_similarities(prompt, [file])[0]
 
     def get_metadata(self) -> dict:
-        return {"model": self.model_name}
+        metadata = {"model": self.model_name}
+        if self.text_cache is not None:
+            metadata["text_cache"] = self.text_cache.stats()
+        return metadata
 
 
 class NSFWChecker(Module):
-    def __init__(self) -> None:
+    """
+    Batched NSFW image classifier.
+
+    `screen_pixels` takes pixels already decoded and normalized for another
+    model and only converts their normalization, so screening costs one
+    batched forward pass per scoring call rather than a decode and a model
+    call per image.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "Falconsai/nsfw_image_detection",
+        batch_size: int = 16,
+        threshold: float = 0.8,
+    ) -> None:
         super().__init__()
-        self.model_name = "Falconsai/nsfw_image_detection"
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threshold = threshold
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.classifier = pipeline(
-            "image-classification",
-            model="Falconsai/nsfw_image_detection",
-            device=self.device,
-        )
+        with log_duration(f"loading {model_name}"):
+            self.model = AutoModelForImageClassification.from_pretrained(
+                model_name, low_cpu_mem_usage=True
+            ).to(self.device)
+            self.model.eval()
+            self.processor = AutoImageProcessor.from_pretrained(model_name)
+        self.nsfw_index = self.model.config.label2id["nsfw"]
+        size = self.processor.size
+        self.image_size = (size["height"], size["width"])
+        self.mean = torch.tensor(self.processor.image_mean, device=self.device).view(1, 3, 1, 1)
+        self.std = torch.tensor(self.processor.image_std, device=self.device).view(1, 3, 1, 1)
+
+    @torch.inference_mode()
+    def _probabilities(self, pixel_values: torch.Tensor) -> list[float]:
+        probabilities = []
+        for start in range(0, len(pixel_values), self.batch_size):
+            chunk = pixel_values[start : start + self.batch_size].to(self.device)
+            logits = self.model(pixel_values=chunk).logits
+            probabilities.extend(logits.softmax(-1)[:, self.nsfw_index].tolist())
+        return probabilities
+
+    def _flag(self, probabilities: list[float]) -> list[bool]:
+        flags = [p > self.threshold for p in probabilities]
+        NSFW_FLAGGED.inc(sum(flags))
+        return flags
+
+    @torch.inference_mode()
+    def screen_pixels(
+        self,
+        pixels: torch.Tensor,
+        mean: tuple[float, ...],
+        std: tuple[float, ...],
+    ) -> list[bool]:
+        """
+        Flags images given as (n, 3, h, w) pixels normalized with `mean` and
+        `std`, resizing them to the classifier's input size when needed.
+        """
+        with NSFW_TIME.time():
+            source_mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1)
+            source_std = torch.tensor(std, device=self.device).view(1, 3, 1, 1)
+            flags = []
+            for start in range(0, len(pixels), self.batch_size):
+                chunk = pixels[start : start + self.batch_size].to(self.device)
+                chunk = chunk * source_std + source_mean
+                if tuple(chunk.shape[-2:]) != self.image_size:
+                    chunk = F.interpolate(
+                        chunk, size=self.image_size, mode="bilinear", antialias=True
+                    )
+                chunk = (chunk - self.mean) / self.std
+                flags.extend(self._flag(self._probabilities(chunk)))
+            return flags
+
+    def check_batch(self, files: list[bytes]) -> list[bool]:
+        """
+        Flags encoded images. Images that can't be decoded are flagged too.
+        """
+        flags = [True] * len(files)
+        images, positions = [], []
+        for i, file in enumerate(files):
+            try:
+                images.append(Image.open(BytesIO(file)).convert("RGB"))
+                positions.append(i)
+            except Exception as e:
+                logger.debug(f"failed to decode image: {e}")
+        if images:
+            pixel_values = self.processor(images=images, return_tensors="pt")["pixel_values"]
+            for i, flag in zip(positions, self._flag(self._probabilities(pixel_values))):
+                flags[i] = flag
+        return flags
 
     def check_nsfw(self, file: bytes) -> bool:
-        image = Image.open(BytesIO(file))
-        for c in self.classifier(image):
-            if c["label"] == "nsfw" and c["score"] > 0.8:
-                return True
-        return False
+        return self.check_batch([file])[0]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+from loguru import logger
+
+from mosaic_subnet.base import SampleInput
+
+if TYPE_CHECKING:
+    from mosaic_subnet.validator import Validator
+
+
+@dataclass
+class RoundChunk:
+    round_id: int
+    input: Optional[SampleInput]
+    uids: list[int] = field(default_factory=list)
+    imgs: list[bytes] = field(default_factory=list)
+    # set on the final chunk of a round, which may carry no images
+    last: bool = False
+
+
+def put_latest(queue: asyncio.Queue, item):
+    """
+    Puts `item` into a bounded queue, dropping the oldest item when full.
+    """
+    if queue.full():
+        queue.get_nowait()
+        logger.info("dropping stale item from queue")
+    queue.put_nowait(item)
+
+
+class ValidationPipeline:
+    """
+    Runs the query, scoring and voting stages of the validator concurrently.
+
+    The query stage starts a round every `iteration_interval` seconds and
+    feeds chunks of answers into a bounded queue, so round N+1 is queried
+    while round N is still being scored into the ledger. The vote stage
+    only ever keeps the newest finished round and hands its weights to the
+    validator's `WeightSubmitter`, so a slow chain never holds up the next
+    round. `run_round` runs a single round through the same stages.
+
+    Stage timings of the last voted round end up in `validator.round_timings`.
+    """
+
+    def __init__(self, validator: "Validator", queue_size: int = 8) -> None:
+        self.validator = validator
+        self.score_queue: asyncio.Queue[RoundChunk] = asyncio.Queue(maxsize=queue_size)
+        self.vote_queue: asyncio.Queue[int] = asyncio.Queue(maxsize=1)
+        # round id -> stage timings of the rounds in progress
+        self.timings: dict[int, dict[str, float]] = {}
+        # text embeddings of the prompts of the round being scored
+        self._text_embeds = {}
+
+    async def feed(self, round_id: int, modules_info: dict, input: SampleInput):
+        async for uids, imgs in self.validator.query_chunks(modules_info, input):
+            await self.score_queue.put(RoundChunk(round_id, input, uids, imgs))
+
+    async def query_round(self):
+        """
+        Starts a round and feeds its answers to the scoring stage, ending
+        with the round's last chunk.
+        """
+        start = time.perf_counter()
+        round_id, modules_info, inputs = self.validator.start_round()
+        timings = self.timings[round_id] = {
+            "start": start, "query": 0.0, "score": 0.0, "vote": 0.0
+        }
+        try:
+            await asyncio.gather(
+                *(self.feed(round_id, modules_info, input) for input in inputs)
+            )
+        except Exception as e:
+            logger.error(e)
+        timings["query"] = time.perf_counter() - start
+        await self.score_queue.put(RoundChunk(round_id, None, last=True))
+
+    async def query_stage(self):
+        validator = self.validator
+        while True:
+            start = time.monotonic()
+            try:
+                await self.query_round()
+            except Exception as e:
+                logger.error(e)
+
+            elapsed = time.monotonic() - start
+            interval = validator.settings.iteration_interval
+            if elapsed < interval:
+                logger.info(f"Sleeping for {interval - elapsed}")
+                await asyncio.sleep(interval - elapsed)
+
+    async def score(self, chunk: RoundChunk):
+        validator = self.validator
+        start = time.perf_counter()
+        try:
+            prompt = chunk.input.prompt
+            if prompt not in self._text_embeds:
+                self._text_embeds[prompt] = await asyncio.to_thread(
+                    validator.model.encode_text, prompt
+                )
+            scores = await asyncio.to_thread(
+                validator.calculate_scores, self._text_embeds[prompt], chunk.imgs
+            )
+            validator.ledger.update(chunk.uids, scores, chunk.round_id)
+        except Exception as e:
+            logger.error(e)
+        if chunk.round_id in self.timings:
+            self.timings[chunk.round_id]["score"] += time.perf_counter() - start
+
+    async def score_stage(self):
+        while True:
+            chunk = await self.score_queue.get()
+            if chunk.last:
+                self._text_embeds.clear()
+                put_latest(self.vote_queue, chunk.round_id)
+                continue
+            await self.score(chunk)
+
+    async def vote(self, round_id: int):
+        validator = self.validator
+        logger.debug(f"round {round_id} scored")
+        start = time.perf_counter()
+        try:
+            # the ledger is only touched from the event loop, a worker thread
+            # could read it halfway through an update; the sigmoid is cheap
+            weighted_scores = validator.get_weights()
+            if weighted_scores:
+                validator.weight_submitter.offer(weighted_scores)
+        except Exception as e:
+            logger.error(e)
+        timings = self.timings.pop(round_id, None)
+        # rounds dropped by `put_latest` never vote
+        for dropped in [r for r in self.timings if r < round_id]:
+            del self.timings[dropped]
+        if timings is not None:
+            timings["vote"] = time.perf_counter() - start
+            timings["total"] = time.perf_counter() - timings.pop("start")
+            validator.round_timings = timings
+
+    async def vote_stage(self):
+        while True:
+            await self.vote(await self.vote_queue.get())
+
+    async def run_round(self):
+        """
+        Queries, scores and votes one round.
+        """
+        scorer = asyncio.create_task(self.score_stage())
+        try:
+            await self.query_round()
+            await self.vote(await self.vote_queue.get())
+        finally:
+            scorer.cancel()
+
+    async def run(self):
+        await asyncio.gather(self.query_stage(), self.score_stage(), self.vote_stage())
@@ -0,0 +1,156 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+import torch
+from PIL import Image
+from loguru import logger
+
+from mosaic_subnet.base.image_codec import sniff_media_type
+from mosaic_subnet.base.metrics import counter
+
+REJECTED = counter("mosaic_validator_rejected_images_total", "Miner images rejected by reason")
+
+ACCEPTED_MEDIA_TYPES = {"image/png", "image/jpeg", "image/webp"}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class ImagePreprocessor:
+    """
+    Decodes miner images into normalized CLIP pixel tensors on a thread pool.
+
+    PIL releases the GIL while decoding and resizing, so the work scales with
+    the number of workers. Every worker writes straight into its row of one
+    reusable buffer (pinned when scoring on a gpu), so there is no per-image
+    tensor and no stacking copy. The buffer is reused by the next call, which
+    is why callers hold `lock` while they use the returned tensor.
+
+    Payloads larger than `max_bytes`, that aren't png, jpeg or webp, or whose
+    header declares more than `max_pixels` are rejected before decoding.
+    """
+
+    def __init__(
+        self,
+        size: int = 224,
+        crop_size: int = 224,
+        mean: tuple[float, ...] = (0.48145466, 0.4578275, 0.40821073),
+        std: tuple[float, ...] = (0.26862954, 0.26130258, 0.27577711),
+        max_bytes: int = 8 * 1024 * 1024,
+        max_pixels: int = 4096 * 4096,
+        workers: Optional[int] = None,
+        pin_memory: bool = False,
+    ) -> None:
+        self.size = size
+        self.crop_size = crop_size
+        self.mean = tuple(mean)
+        self.std = tuple(std)
+        # (x / 255 - mean) / std as one multiply-add
+        std = np.asarray(std, dtype=np.float32)
+        self._scale = (1 / (255 * std)).reshape(3, 1, 1)
+        self._offset = (-np.asarray(mean, dtype=np.float32) / std).reshape(3, 1, 1)
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.pin_memory = pin_memory
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count(), thread_name_prefix="preprocess"
+        )
+        self.lock = threading.Lock()
+        self._buffer = torch.empty(0)
+
+    @classmethod
+    def from_processor(cls, processor, **kwargs) -> "ImagePreprocessor":
+        """
+        Takes the resize, crop and normalization parameters of a transformers
+        `CLIPProcessor`.
+        """
+        image_processor = processor.image_processor
+        crop = image_processor.crop_size
+        return cls(
+            size=image_processor.size["shortest_edge"],
+            crop_size=crop["height"] if isinstance(crop, dict) else crop,
+            mean=tuple(image_processor.image_mean),
+            std=tuple(image_processor.image_std),
+            **kwargs,
+        )
+
+    def _ensure(self, count: int) -> torch.Tensor:
+        if self._buffer.shape[0] < count:
+            self._buffer = torch.empty(
+                (max(count, 2 * self._buffer.shape[0]), 3, self.crop_size, self.crop_size),
+                dtype=torch.float32,
+                pin_memory=self.pin_memory,
+            )
+        return self._buffer
+
+    def check(self, file: bytes) -> Optional[str]:
+        """
+        Returns why `file` is rejected, or None if it may be decoded.
+        """
+        if not file:
+            return "empty"
+        if len(file) > self.max_bytes:
+            return "too_large"
+        if sniff_media_type(file) not in ACCEPTED_MEDIA_TYPES:
+            return "unknown_format"
+        return None
+
+    def decode(self, file: bytes) -> Image.Image:
+        """
+        Decodes one accepted payload into an RGB image, checking the declared
+        size before any pixel data is read.
+        """
+        image = Image.open(BytesIO(file))
+        width, height = image.size
+        if width * height > self.max_pixels:
+            raise ImageTooLarge(f"image of {width}x{height} pixels is too large")
+        return image.convert("RGB")
+
+    def _resize_crop(self, image: Image.Image) -> Image.Image:
+        # resize the short side to `size`, then center crop, like CLIPImageProcessor
+        width, height = image.size
+        short, long = (width, height) if width <= height else (height, width)
+        new_short, new_long = self.size, int(self.size * long / short)
+        new_width, new_height = (
+            (new_short, new_long) if width <= height else (new_long, new_short)
+        )
+        image = image.resize((new_width, new_height), resample=Image.BICUBIC)
+        top = (new_height - self.crop_size) // 2
+        left = (new_width - self.crop_size) // 2
+        return image.crop((left, top, left + self.crop_size, top + self.crop_size))
+
+    def _process(self, file: bytes, row: np.ndarray) -> bool:
+        reason = self.check(file)
+        if reason is None:
+            try:
+                image = self._resize_crop(self.decode(file))
+                pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1)
+                np.multiply(pixels, self._scale, out=row)
+                row += self._offset
+                return True
+            except ImageTooLarge:
+                reason = "too_many_pixels"
+            except Exception as e:
+                logger.debug(f"failed to decode image: {e}")
+                reason = "malformed"
+        REJECTED.inc(reason=reason)
+        return False
+
+    def __call__(self, files: list[bytes]) -> tuple[torch.Tensor, list[int]]:
+        """
+        Returns the pixel values of the images that could be decoded, shape
+        (n, 3, crop_size, crop_size), and their positions in `files`. The
+        tensor is a view of the shared buffer; hold `lock` until done with it.
+        """
+        buffer = self._ensure(len(files))
+        rows = buffer.numpy()
+        ok = list(self.pool.map(self._process, files, rows[: len(files)]))
+        positions = [i for i, decoded in enumerate(ok) if decoded]
+        if len(positions) == len(files):
+            return buffer[: len(files)], positions
+        return buffer[positions], positions
@@ -0,0 +1,99 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from typing import Iterator, Optional
+
+import numpy as np
+from loguru import logger
+
+MAGIC = b"MSPS0001"
+HEADER = struct.Struct("<8sQ")
+
+
+def iter_source(source: str, text_column: str = "text") -> Iterator[str]:
+    """
+    Yields prompts from a local .txt file (one prompt per line), a local
+    .parquet file or, otherwise, the train split of a huggingface dataset.
+    """
+    if source.endswith(".txt"):
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+    elif source.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(columns=[text_column]):
+            yield from batch.column(0).to_pylist()
+    else:
+        from datasets import load_dataset
+
+        for row in load_dataset(source, split="train", streaming=True):
+            yield row[text_column]
+
+
+def build_prompt_store(
+    path: str,
+    source: str,
+    subset_size: Optional[int] = None,
+    text_column: str = "text",
+):
+    """
+    Writes prompts from `source` to `path` as a header, an array of
+    count + 1 little-endian uint64 offsets and one utf-8 blob.
+    """
+    offsets = array("Q", [0])
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        for prompt in iter_source(source, text_column):
+            if not prompt or not prompt.strip():
+                continue
+            data = prompt.strip().encode("utf-8")
+            blob.write(data)
+            offsets.append(offsets[-1] + len(data))
+            if subset_size and len(offsets) > subset_size:
+                break
+        count = len(offsets) - 1
+        if count == 0:
+            raise ValueError(f"no prompts found in {source}")
+        blob.seek(0)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count))
+            # array writes native order, the reader expects little-endian
+            f.write(np.asarray(offsets, dtype="<u8").tobytes())
+            shutil.copyfileobj(blob, f)
+        os.replace(tmp, path)
+    logger.info(f"built prompt store with {count} prompts at {path}")
+
+
+class PromptStore:
+    """
+    Read-only, memory-mapped prompt file written by `build_prompt_store`.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a prompt store")
+        self._count = count
+        self._offsets = np.frombuffer(
+            self._mmap, dtype="<u8", count=count + 1, offset=HEADER.size
+        )
+        self._blob_start = HEADER.size + self._offsets.nbytes
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._blob_start + int(self._offsets[index])
+        end = self._blob_start + int(self._offsets[index + 1])
+        return self._mmap[start:end].decode("utf-8")
@@ -0,0 +1,60 @@
+import math
+from typing import Optional, TypeVar
+
+import numpy as np
+
+from mosaic_subnet.base.metrics import gauge
+from mosaic_subnet.validator.ledger import ScoreLedger
+
+SCHEDULED = gauge("mosaic_validator_scheduled_miners", "Miners queried in the current round")
+
+T = TypeVar("T")
+
+
+class MinerScheduler:
+    """
+    Picks the miners queried in a round, at most `budget` of them.
+
+    The ceil(n / rotation_rounds) uids scored the longest ago are always
+    picked, so every miner is queried at least once every `rotation_rounds`
+    rounds; the budget is raised to that floor when it is lower. The rest of
+    the budget goes to uids that were never scored, then to the ones ranked
+    highest by staleness plus score standard deviation, so miners whose
+    scores are stable are queried less often than noisy ones.
+
+    `rotation_rounds` should not exceed the validator's `score_max_age`,
+    or miners lose their weight between two queries.
+    """
+
+    def __init__(
+        self,
+        budget: Optional[int] = None,
+        rotation_rounds: int = 5,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.budget = budget
+        self.rotation_rounds = max(1, rotation_rounds)
+        # breaks ties between miners with the same history
+        self._rng = np.random.default_rng(seed)
+
+    def select(self, modules_info: dict[int, T], ledger: ScoreLedger) -> dict[int, T]:
+        count = len(modules_info)
+        if not self.budget or count <= self.budget:
+            SCHEDULED.set(count)
+            return modules_info
+        uids = np.fromiter(modules_info, dtype=np.int64, count=count)
+        counts, age, std = ledger.sampling_stats(uids)
+        jitter = self._rng.random(count) * 1e-6
+
+        floor = math.ceil(count / self.rotation_rounds)
+        budget = max(self.budget, floor)
+        stalest = np.argsort(-(age + jitter), kind="stable")[:floor]
+
+        priority = age / self.rotation_rounds + std / max(float(std.max()), 1e-9) + jitter
+        priority[counts == 0] = np.inf
+        priority[stalest] = -np.inf
+        ranked = np.argsort(-priority, kind="stable")[: budget - floor]
+
+        picked = np.concatenate([stalest, ranked])
+        SCHEDULED.set(len(picked))
+        return {int(uid): modules_info[int(uid)] for uid in uids[picked]}
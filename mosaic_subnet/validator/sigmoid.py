@@ -1,8 +1,33 @@
 import math
 
+import numpy as np
+
 def sigmoid(x: float):
     return 1 / (1 + math.exp(-x))
 
+def threshold_sigmoid_rewards(scores: np.ndarray) -> np.ndarray:
+    """
+    Vectorized form of `threshold_sigmoid_reward_distribution` over an array of scores.
+    """
+    # Set the threshold as a percentage above the mean score
+    threshold_percentage = 0.2
+    threshold = scores.mean() * (1 + threshold_percentage)
+
+    steepness = 5.0  # steepness for sharper punishment
+
+    # Set the high and low rewards
+    high_reward = 1.0
+    low_reward = 0.01
+
+    reward_ratio = 1 / (1 + np.exp(-(scores - threshold) * steepness))
+    return low_reward + (high_reward - low_reward) * reward_ratio
+
+def normalize_weights(rewards: np.ndarray, total: int = 1000) -> np.ndarray:
+    """
+    Scales rewards to integer weights summing to at most `total`.
+    """
+    return (rewards * total / rewards.sum()).astype(np.int64)
+
 def threshold_sigmoid_reward_distribution(score_dict: dict[int, float]) -> dict[int, float]:
     """
     Adjusts the distribution of scores, such that the best miners are rewarded significantly more than the rest.
@@ -14,26 +39,7 @@ def threshold_sigmoid_reward_distribution(score_dict: dict[int, float]) -> dict[
     Returns:
         A dictionary mapping miner UIDs to their adjusted scores.
     """
-    # Calculate the mean score
-    mean_score = sum(score_dict.values()) / len(score_dict)
-
-    # Set the threshold as a percentage above the mean score
-    threshold_percentage = 0.2  
-    threshold = mean_score * (1 + threshold_percentage)
-
-   
-    steepness = 5.0  # steepness for sharper punishment
-
-    # Set the high and low rewards
-    high_reward = 1.0
-    low_reward = 0.01  
-
-    # Calculate the adjusted scores using the sigmoid function
-    adjusted_scores : dict[int, float] = {}
-    for model_id, score in score_dict.items():
-        normalized_score = (score - threshold) * steepness
-        reward_ratio = sigmoid(normalized_score)
-        adjusted_score = low_reward + (high_reward - low_reward) * reward_ratio
-        adjusted_scores[model_id] = adjusted_score
-
-    return adjusted_scores
+    uids = list(score_dict.keys())
+    scores = np.fromiter(score_dict.values(), dtype=np.float64, count=len(uids))
+    adjusted_scores = threshold_sigmoid_rewards(scores)
+    return dict(zip(uids, adjusted_scores.tolist()))
@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+
+from mosaic_subnet.base.metrics import counter
+
+SUBMISSIONS = counter(
+    "mosaic_validator_weight_submissions_total", "Weight vectors handed to the submitter by outcome"
+)
+
+
+def weight_change(old: dict[int, int], new: dict[int, int]) -> float:
+    """
+    Total variation distance between two weight vectors once normalized,
+    from 0 for the same distribution to 1 for disjoint ones.
+    """
+    old_total = sum(old.values()) or 1
+    new_total = sum(new.values()) or 1
+    return (
+        sum(
+            abs(old.get(uid, 0) / old_total - new.get(uid, 0) / new_total)
+            for uid in old.keys() | new.keys()
+        )
+        / 2
+    )
+
+
+class WeightSubmitter:
+    """
+    Submits weights on chain from a background thread, so scoring never
+    waits on the chain.
+
+    `offer` only keeps the newest weight vector, replacing one that wasn't
+    submitted yet. At most every `interval` seconds the thread submits it,
+    unless it differs from the last submitted vector by less than
+    `min_change`, see `weight_change`. A failed submission is retried after
+    `retry_delay` seconds, doubling up to `max_backoff`, with whichever
+    vector is the newest by then.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[dict[int, int]], None],
+        interval: float = 60,
+        min_change: float = 0.01,
+        retry_delay: float = 5,
+        max_backoff: float = 300,
+    ) -> None:
+        self.submit = submit
+        self.interval = interval
+        self.min_change = min_change
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self.last_submitted: Optional[dict[int, int]] = None
+        self._pending: Optional[dict[int, int]] = None
+        self._due = 0.0
+        self._failures = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def offer(self, weights: dict[int, int]):
+        with self._cond:
+            if self._pending is not None:
+                SUBMISSIONS.inc(outcome="replaced")
+            self._pending = weights
+            self._cond.notify()
+
+    def _next(self) -> dict[int, int]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._pending is not None and now >= self._due:
+                    weights, self._pending = self._pending, None
+                    return weights
+                self._cond.wait(None if self._pending is None else self._due - now)
+
+    def _retry(self, weights: dict[int, int]):
+        with self._cond:
+            # a newer vector offered in the meantime wins
+            if self._pending is None:
+                self._pending = weights
+        self._failures += 1
+        backoff = min(self.retry_delay * 2 ** (self._failures - 1), self.max_backoff)
+        logger.info(f"retrying weight submission in {backoff:.1f}s")
+        self._due = time.monotonic() + backoff
+
+    def submit_next(self):
+        weights = self._next()
+        if self.last_submitted is not None:
+            change = weight_change(self.last_submitted, weights)
+            if change < self.min_change:
+                SUBMISSIONS.inc(outcome="unchanged")
+                logger.info(f"weights changed by {change:.4f}, skip set weights")
+                self._due = time.monotonic() + self.interval
+                return
+        try:
+            self.submit(weights)
+        except Exception as e:
+            SUBMISSIONS.inc(outcome="failed")
+            logger.error(f"failed to set weights: {e}")
+            self._retry(weights)
+            return
+        SUBMISSIONS.inc(outcome="submitted")
+        self.last_submitted = weights
+        self._failures = 0
+        self._due = time.monotonic() + self.interval
+
+    def submit_loop(self):
+        while True:
+            self.submit_next()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        logger.info("start weight submission loop")
+        self._thread = threading.Thread(target=self.submit_loop, daemon=True)
+        self._thread.start()
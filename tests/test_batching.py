@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# the miner package loads the diffusion pipeline modules
+pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from mosaic_subnet.miner.batching import (  # noqa: E402
+    DEFAULT_PRIORITY,
+    VALIDATOR_PRIORITY,
+    MicroBatcher,
+    QueueFull,
+    SampleRequest,
+)
+
+
+class Pipeline:
+    """
+    Records the prompts of every batch; blocks while `gate` is cleared.
+    """
+
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def __call__(self, batch: list[SampleRequest]) -> list[str]:
+        self.started.set()
+        self.gate.wait()
+        self.batches.append([request.prompt for request in batch])
+        return [f"image of {request.prompt}" for request in batch]
+
+
+def blocked(pipeline: Pipeline, batcher: MicroBatcher) -> SampleRequest:
+    # occupies the worker so that later requests stay queued
+    pipeline.gate.clear()
+    request = SampleRequest(priority=DEFAULT_PRIORITY, prompt="blocker")
+    batcher.enqueue(request)
+    assert pipeline.started.wait(1)
+    return request
+
+
+def test_concurrent_calls_share_a_batch():
+    pipeline = Pipeline()
+    batcher = MicroBatcher(pipeline, max_batch_size=4, window=0.2)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(
+            pool.map(lambda i: batcher.submit(f"p{i}", "", steps=2, seed=i), range(4))
+        )
+    assert results == [f"image of p{i}" for i in range(4)]
+    assert [sorted(batch) for batch in pipeline.batches] == [["p0", "p1", "p2", "p3"]]
+
+
+def test_batches_only_group_the_same_steps():
+    pipeline = Pipeline()
+    batcher = MicroBatcher(pipeline, max_batch_size=4, window=0.05)
+    blocker = blocked(pipeline, batcher)
+    requests = [
+        SampleRequest(priority=DEFAULT_PRIORITY, prompt=f"p{i}", steps=steps)
+        for i, steps in enumerate([2, 4, 2, 4])
+    ]
+    for request in requests:
+        batcher.enqueue(request)
+    pipeline.gate.set()
+    for request in [blocker, *requests]:
+        request.future.result(timeout=2)
+    assert pipeline.batches == [["blocker"], ["p0", "p2"], ["p1", "p3"]]
+
+
+def test_validator_requests_are_served_first():
+    pipeline = Pipeline()
+    batcher = MicroBatcher(pipeline, max_batch_size=1, window=0)
+    blocker = blocked(pipeline, batcher)
+    user = SampleRequest(priority=DEFAULT_PRIORITY, prompt="user")
+    validator = SampleRequest(priority=VALIDATOR_PRIORITY, prompt="validator")
+    batcher.enqueue(user)
+    batcher.enqueue(validator)
+    pipeline.gate.set()
+    for request in (blocker, user, validator):
+        request.future.result(timeout=2)
+    assert pipeline.batches == [["blocker"], ["validator"], ["user"]]
+
+
+def test_full_queue_evicts_lower_priority_or_rejects():
+    pipeline = Pipeline()
+    batcher = MicroBatcher(pipeline, max_batch_size=1, window=0, max_queue_size=2)
+    blocker = blocked(pipeline, batcher)
+    first = SampleRequest(priority=DEFAULT_PRIORITY, prompt="first")
+    second = SampleRequest(priority=DEFAULT_PRIORITY, prompt="second")
+    batcher.enqueue(first)
+    batcher.enqueue(second)
+
+    assert not batcher.admits(DEFAULT_PRIORITY)
+    with pytest.raises(QueueFull):
+        batcher.enqueue(SampleRequest(priority=DEFAULT_PRIORITY, prompt="third"))
+
+    assert batcher.admits(VALIDATOR_PRIORITY)
+    validator = SampleRequest(priority=VALIDATOR_PRIORITY, prompt="validator")
+    batcher.enqueue(validator)
+    # the newest lower priority request makes room
+    with pytest.raises(QueueFull):
+        second.future.result(timeout=1)
+
+    pipeline.gate.set()
+    for request in (blocker, first, validator):
+        request.future.result(timeout=2)
+    assert pipeline.batches == [["blocker"], ["validator"], ["first"]]
+
+
+def test_pipeline_errors_reach_every_caller():
+    def failing(batch):
+        raise RuntimeError("out of memory")
+
+    batcher = MicroBatcher(failing, max_batch_size=2, window=0.1)
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(batcher.submit, f"p{i}", "", 2, i) for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=2)
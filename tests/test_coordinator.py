@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from mosaic_subnet.gateway._config import GatewaySettings
+from mosaic_subnet.gateway.coordinator import claim_worker_slot, worker_cache_settings
+
+
+def test_workers_claim_distinct_slots(tmp_path):
+    first, first_lock = claim_worker_slot(str(tmp_path), 2)
+    second, second_lock = claim_worker_slot(str(tmp_path), 2)
+    assert {first, second} == {0, 1}
+    with pytest.raises(RuntimeError):
+        claim_worker_slot(str(tmp_path), 2, timeout=0)
+    # a restarted worker takes over the slot of the one that exited
+    first_lock.close()
+    assert claim_worker_slot(str(tmp_path), 2)[0] == first
+    second_lock.close()
+
+
+def test_worker_cache_settings_split_the_budgets(tmp_path):
+    settings = GatewaySettings(
+        host="127.0.0.1",
+        port=0,
+        workers=4,
+        result_cache_path=str(tmp_path),
+        result_cache_memory_bytes=400,
+        result_cache_disk_bytes=4000,
+    )
+    worker = worker_cache_settings(settings, 3)
+    assert worker.result_cache_path == os.path.join(str(tmp_path), "worker-3")
+    assert worker.result_cache_memory_bytes == 100
+    assert worker.result_cache_disk_bytes == 1000
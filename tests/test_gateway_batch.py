@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from communex.key import generate_keypair
+
+from mosaic_subnet.base import SampleInput
+from mosaic_subnet.bench.fake_chain import FakeCommuneClient
+from mosaic_subnet.bench.stub_miner import StubMinerConfig, StubMinerFleet
+from mosaic_subnet.gateway import Gateway
+from mosaic_subnet.gateway._config import GatewaySettings
+
+MINERS = 4
+CAP = 2
+
+
+@pytest.fixture(scope="module")
+def fleet():
+    config = StubMinerConfig(latency=0.2, latency_jitter=0.05, image_size=64)
+    with StubMinerFleet(MINERS, config) as fleet:
+        yield fleet
+
+
+def make_gateway(fleet, **settings) -> Gateway:
+    key = generate_keypair()
+    client = FakeCommuneClient(key.ss58_address, fleet.miners)
+    return Gateway(
+        key=key,
+        settings=GatewaySettings(
+            host="127.0.0.1",
+            port=0,
+            netuid=client.netuid,
+            call_timeout=10,
+            top_miners=MINERS,
+            result_cache=False,
+            batch_max_in_flight_per_miner=CAP,
+            **settings,
+        ),
+        c_client=client,
+    )
+
+
+async def collect(gateway: Gateway, count: int) -> list:
+    reqs = [SampleInput(prompt=f"batch {i}", steps=2) for i in range(count)]
+    return [item async for item in gateway.generate_batch(reqs)]
+
+
+async def watch_in_flight(gateway: Gateway, peaks: dict[int, int]):
+    while True:
+        for uid, stats in gateway.routing.stats.items():
+            peaks[uid] = max(peaks.get(uid, 0), stats.in_flight)
+        await asyncio.sleep(0.005)
+
+
+def test_batch_waits_for_busy_miners(fleet):
+    gateway = make_gateway(fleet)
+
+    async def run():
+        singles = [
+            asyncio.create_task(gateway.generate(SampleInput(prompt=f"single {i}", steps=2)))
+            for i in range(24)
+        ]
+        # let the single requests take every miner over the batch cap
+        await asyncio.sleep(0.05)
+        items = await collect(gateway, 32)
+        singles = await asyncio.gather(*singles)
+        await gateway.pool.close()
+        return items, singles
+
+    items, singles = asyncio.run(run())
+    assert all(singles)
+    assert sorted(index for index, _, _ in items) == list(range(32))
+    assert [error for _, _, error in items if error] == []
+
+
+def test_batch_hedges_respect_the_cap(fleet):
+    gateway = make_gateway(fleet, hedge_delay=0.05)
+    peaks: dict[int, int] = {}
+
+    async def run():
+        watcher = asyncio.create_task(watch_in_flight(gateway, peaks))
+        try:
+            return await collect(gateway, 64)
+        finally:
+            watcher.cancel()
+            await gateway.pool.close()
+
+    items = asyncio.run(run())
+    assert [error for _, _, error in items if error] == []
+    assert max(peaks.values()) <= CAP
+    assert all(stats.in_flight == 0 for stats in gateway.routing.stats.values())
@@ -0,0 +1,63 @@
+import asyncio
+
+from communex.key import generate_keypair
+
+import mosaic_subnet.gateway as gateway_module
+from mosaic_subnet.base import SampleInput
+from mosaic_subnet.base.image_codec import to_transport
+from mosaic_subnet.bench.fake_chain import FakeCommuneClient
+from mosaic_subnet.bench.stub_miner import StubMiner
+from mosaic_subnet.gateway import Gateway
+from mosaic_subnet.gateway._config import GatewaySettings
+
+REQ = SampleInput(prompt="stream", steps=4)
+
+
+def make_gateway(monkeypatch, previews: int) -> Gateway:
+    async def stream_miner(key, miner_info, input, timeout, preview_every=4, pool=None):
+        for step in range(previews):
+            await asyncio.sleep(0.01)
+            yield {"event": "preview", "step": step, "image": to_transport(b"preview")}
+        yield {"event": "image", "image": to_transport(b"image")}
+
+    monkeypatch.setattr(gateway_module, "stream_miner", stream_miner)
+    miners = [StubMiner(uid=uid, port=uid, key=generate_keypair()) for uid in (1, 2)]
+    key = generate_keypair()
+    client = FakeCommuneClient(key.ss58_address, miners)
+    return Gateway(
+        key=key,
+        settings=GatewaySettings(
+            host="127.0.0.1", port=0, netuid=client.netuid, result_cache=False
+        ),
+        c_client=client,
+    )
+
+
+def in_flight(gateway: Gateway) -> int:
+    return sum(stats.in_flight for stats in gateway.routing.stats.values())
+
+
+def test_stream_relays_previews_then_image(monkeypatch):
+    gateway = make_gateway(monkeypatch, previews=2)
+
+    async def run():
+        return [event async for event in gateway.generate_stream(REQ, preview_every=2)]
+
+    events = asyncio.run(run())
+    assert [event["event"] for event in events] == ["preview", "preview", "image"]
+    assert events[-1]["image"] == b"image"
+    assert in_flight(gateway) == 0
+
+
+def test_client_disconnect_releases_the_miner(monkeypatch):
+    gateway = make_gateway(monkeypatch, previews=5)
+
+    async def run():
+        events = gateway.generate_stream(REQ, preview_every=1)
+        assert (await events.__anext__())["event"] == "preview"
+        assert in_flight(gateway) == 1
+        # what starlette does when the client goes away mid-stream
+        await events.aclose()
+
+    asyncio.run(run())
+    assert in_flight(gateway) == 0
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from mosaic_subnet.gateway.hedging import LatencyWindow, hedged_call
+
+
+def miners(behaviour: dict[str, tuple[float, bytes | None]], calls: list[str]):
+    async def call(name: str):
+        calls.append(name)
+        delay, result = behaviour[name]
+        await asyncio.sleep(delay)
+        return result
+
+    return call
+
+
+def run(candidates, behaviour, **kwargs):
+    calls: list[str] = []
+    options = {"hedge_delay": 0.05, "max_attempts": 3, "timeout": 2.0, **kwargs}
+    start = time.monotonic()
+    winner, result = asyncio.run(hedged_call(candidates, miners(behaviour, calls), **options))
+    return winner, result, calls, time.monotonic() - start
+
+
+def test_fast_first_candidate_is_not_hedged():
+    winner, result, calls, _ = run(["a", "b"], {"a": (0.01, b"a"), "b": (0.01, b"b")})
+    assert (winner, result, calls) == ("a", b"a", ["a"])
+
+
+def test_slow_first_candidate_is_hedged():
+    winner, result, calls, elapsed = run(["a", "b"], {"a": (1.0, b"a"), "b": (0.01, b"b")})
+    assert (winner, result, calls) == ("b", b"b", ["a", "b"])
+    assert elapsed < 0.5
+
+
+def test_failures_are_retried_on_the_next_candidate():
+    winner, result, calls, _ = run(
+        ["a", "b", "c"],
+        {"a": (0.0, None), "b": (0.0, None), "c": (0.0, b"c")},
+        hedge_delay=10,
+    )
+    assert (winner, result, calls) == ("c", b"c", ["a", "b", "c"])
+
+
+def test_attempts_and_time_are_bounded():
+    behaviour = {name: (0.0, None) for name in "abcd"}
+    assert run(list("abcd"), behaviour, max_attempts=2)[:3] == (None, None, ["a", "b"])
+
+    winner, result, _, elapsed = run(["a"], {"a": (5.0, b"a")}, timeout=0.2)
+    assert (winner, result) == (None, None)
+    assert elapsed < 1.0
+
+
+def test_latency_window_quantiles():
+    window = LatencyWindow(size=100)
+    assert window.quantile(0.9) is None
+    for latency in range(200):
+        window.record(float(latency))
+    assert len(window) == 100
+    assert window.quantile(0.0) == 100.0
+    assert window.quantile(0.5) == 150.0
+    assert window.quantile(1.0) == 199.0
@@ -0,0 +1,49 @@
+from mosaic_subnet.validator.ledger import ScoreLedger
+
+
+def test_first_score_then_ema():
+    ledger = ScoreLedger(alpha=0.5)
+    round_id = ledger.next_round()
+    ledger.update([3], [1.0], round_id)
+    assert ledger.ema[3] == 1.0
+    ledger.update([3], [0.0], round_id)
+    assert ledger.ema[3] == 0.5
+    assert ledger.counts[3] == 2
+    assert ledger.last_seen[3] == round_id
+
+
+def test_grows_for_large_uids():
+    ledger = ScoreLedger(size=4)
+    ledger.next_round()
+    ledger.update([1000], [0.7])
+    assert len(ledger.ema) > 1000
+    assert ledger.ema[1000] == 0.7
+    assert ledger.counts[:1000].sum() == 0
+    assert (ledger.last_seen[:1000] == -1).all()
+
+
+def test_weights_only_cover_recent_uids():
+    ledger = ScoreLedger()
+    ledger.next_round()
+    ledger.update([1, 2], [0.9, 0.8])
+    for _ in range(3):
+        ledger.next_round()
+    ledger.update([3], [0.9])
+
+    uids, weights = ledger.weights(max_age=2)
+    assert uids.tolist() == [3]
+    assert weights.sum() <= 1000
+
+    uids, _ = ledger.weights(max_age=10)
+    assert uids.tolist() == [1, 2, 3]
+
+
+def test_key_change_resets_history():
+    ledger = ScoreLedger()
+    ledger.sync_keys({1: "a", 2: "b"})
+    ledger.next_round()
+    ledger.update([1, 2], [0.9, 0.9])
+    ledger.sync_keys({1: "a", 2: "c"})
+    assert ledger.counts[[1, 2]].tolist() == [1, 0]
+    assert ledger.last_seen[2] == -1
+
@@ -0,0 +1,42 @@
+import pytest
+from pydantic import ValidationError
+
+# the miner package loads the diffusion pipeline modules
+pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+from mosaic_subnet.miner.model import DiffUsers  # noqa: E402
+from mosaic_subnet.miner.streaming import StreamInput  # noqa: E402
+
+
+class Batcher:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def submit(self, *args, **kwargs):
+        self.calls += 1
+
+    def enqueue(self, request):
+        self.calls += 1
+
+
+def unloaded_model() -> DiffUsers:
+    # skips loading the pipeline, only the request handling is under test
+    model = DiffUsers.__new__(DiffUsers)
+    model.batcher = Batcher()
+    return model
+
+
+def test_unknown_encoding_is_rejected_before_batching():
+    params = DiffUsers.sample._endpoint_def.params_model
+    with pytest.raises(ValidationError):
+        params(prompt="a cat", encoding="gif")
+    with pytest.raises(ValidationError):
+        StreamInput(prompt="a cat", encoding="gif")
+
+    model = unloaded_model()
+    with pytest.raises(ValueError):
+        model.sample(prompt="a cat", seed=1, encoding="gif")
+    with pytest.raises(ValueError):
+        model.sample_stream(prompt="a cat", seed=1, encoding="gif")
+    assert model.batcher.calls == 0
@@ -0,0 +1,47 @@
+import struct
+
+import pytest
+
+from mosaic_subnet.validator.prompt_store import HEADER, PromptStore, build_prompt_store
+
+
+def write_source(tmp_path, lines: list[str]) -> str:
+    source = tmp_path / "prompts.txt"
+    source.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(source)
+
+
+def test_round_trip(tmp_path):
+    source = write_source(tmp_path, ["a cat", "", "  ", " un café ", "雪の山"])
+    path = str(tmp_path / "store" / "prompts.bin")
+    build_prompt_store(path, source)
+
+    store = PromptStore(path)
+    assert len(store) == 3
+    assert [store[i] for i in range(len(store))] == ["a cat", "un café", "雪の山"]
+    with pytest.raises(IndexError):
+        store[3]
+
+
+def test_offsets_are_little_endian_on_disk(tmp_path):
+    source = write_source(tmp_path, ["a cat", "a dog!"])
+    path = tmp_path / "prompts.bin"
+    build_prompt_store(str(path), source)
+    data = path.read_bytes()
+    assert struct.unpack_from("<3Q", data, HEADER.size) == (0, 5, 11)
+
+
+def test_subset_size(tmp_path):
+    source = write_source(tmp_path, [f"prompt {i}" for i in range(10)])
+    path = str(tmp_path / "prompts.bin")
+    build_prompt_store(path, source, subset_size=4)
+    assert len(PromptStore(path)) == 4
+
+
+def test_rejects_empty_sources_and_foreign_files(tmp_path):
+    with pytest.raises(ValueError):
+        build_prompt_store(str(tmp_path / "prompts.bin"), write_source(tmp_path, ["", " "]))
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        PromptStore(str(other))
@@ -0,0 +1,75 @@
+import asyncio
+
+from communex.key import generate_keypair
+
+from mosaic_subnet.base import SampleInput
+from mosaic_subnet.base import query
+from mosaic_subnet.base.query import MinerQueryEngine
+
+INPUT = SampleInput(prompt="test", steps=2)
+
+
+def fake_miners(monkeypatch, latencies: dict[int, float]) -> dict:
+    async def call_miner(key, miner_info, input, timeout, pool=None):
+        uid = int(miner_info[0][1])
+        await asyncio.sleep(latencies[uid])
+        return f"image {uid}".encode()
+
+    monkeypatch.setattr(query, "call_miner", call_miner)
+    return {uid: (["127.0.0.1", str(uid)], f"key{uid}") for uid in latencies}
+
+
+def make_engine(**kwargs) -> MinerQueryEngine:
+    return MinerQueryEngine(key=generate_keypair(), **kwargs)
+
+
+def test_stream_times_out_slow_miners(monkeypatch):
+    modules_info = fake_miners(monkeypatch, {1: 0.05, 2: 0.1, 3: 5.0})
+    engine = make_engine(call_timeout=10, round_timeout=0.3)
+
+    async def run():
+        return [item async for item in engine.stream(modules_info, INPUT)]
+
+    assert asyncio.run(run()) == [(1, b"image 1"), (2, b"image 2"), (3, None)]
+
+
+def test_stream_keeps_answers_while_consumer_is_busy(monkeypatch):
+    latencies = {1: 0.1, 2: 0.15, 3: 0.2, 4: 0.25, 5: 0.3}
+    modules_info = fake_miners(monkeypatch, latencies)
+    engine = make_engine(call_timeout=10, round_timeout=0.5)
+
+    async def run():
+        results = {}
+        async for uid, image in engine.stream(modules_info, INPUT):
+            results[uid] = image
+            # a consumer blocked past the deadline, like a full score queue
+            await asyncio.sleep(0.6)
+        return results
+
+    results = asyncio.run(run())
+    assert results == {uid: f"image {uid}".encode() for uid in latencies}
+
+
+def test_concurrency_cap_is_shared_by_concurrent_prompts(monkeypatch):
+    running = 0
+    peak = 0
+
+    async def call_miner(key, miner_info, input, timeout, pool=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return b"image"
+
+    monkeypatch.setattr(query, "call_miner", call_miner)
+    modules_info = {uid: (["127.0.0.1", str(uid)], f"key{uid}") for uid in range(8)}
+    engine = make_engine(call_timeout=10, max_concurrency=3)
+
+    async def run():
+        await asyncio.gather(
+            engine.gather(modules_info, INPUT), engine.gather(modules_info, INPUT)
+        )
+
+    asyncio.run(run())
+    assert peak == 3
@@ -0,0 +1,51 @@
+import os
+
+from mosaic_subnet.base import SampleInput
+from mosaic_subnet.gateway.cache import HEADER, ResultCache, result_key
+
+
+def test_only_seeded_requests_have_a_key():
+    assert result_key(SampleInput(prompt="a cat"), "sdxl") is None
+    seeded = SampleInput(prompt="a cat", seed=1)
+    assert result_key(seeded, "sdxl") == result_key(SampleInput(prompt="a cat", seed=1), "sdxl")
+    assert result_key(seeded, "sdxl") != result_key(seeded, "other")
+    assert result_key(seeded, "sdxl") != result_key(SampleInput(prompt="a cat", seed=2), "sdxl")
+
+
+def test_entries_expire_after_their_ttl():
+    cache = ResultCache()
+    cache.put("a", b"image", ttl=-1)
+    cache.put("b", b"image", ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("b") == b"image"
+
+
+def test_memory_tier_evicts_least_recently_used_bytes():
+    cache = ResultCache(max_memory_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.memory_bytes == 8
+    # larger than the whole tier, never cached in memory
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None
+
+
+def test_disk_tier_survives_restarts_and_evicts_by_bytes(tmp_path):
+    entry = HEADER.size + 4
+    cache = ResultCache(max_memory_bytes=4, path=str(tmp_path), max_disk_bytes=2 * entry)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert not os.path.exists(tmp_path / "b.bin")
+    assert cache.disk_bytes == 2 * entry
+
+    restarted = ResultCache(path=str(tmp_path), max_disk_bytes=2 * entry)
+    assert restarted.get("a") == b"aaaa"
+    assert restarted.get("c") == b"cccc"
+    assert restarted.get("b") is None
+    assert restarted.disk_hits == 2
@@ -0,0 +1,81 @@
+import numpy as np
+
+from mosaic_subnet.validator.ledger import ScoreLedger
+from mosaic_subnet.validator.scheduler import MinerScheduler
+
+
+def modules(count: int) -> dict:
+    return {uid: (["127.0.0.1", str(8000 + uid)], f"key{uid}") for uid in range(1, count + 1)}
+
+
+def simulate(scheduler: MinerScheduler, info: dict, rounds: int, noise: dict):
+    ledger = ScoreLedger()
+    rng = np.random.default_rng(0)
+    history = []
+    for _ in range(rounds):
+        round_id = ledger.next_round()
+        picked = scheduler.select(info, ledger)
+        history.append(set(picked))
+        uids = list(picked)
+        ledger.update(uids, [0.5 + rng.normal(0, noise[uid]) for uid in uids], round_id)
+    return history
+
+
+def test_queries_everything_without_budget():
+    info = modules(10)
+    assert MinerScheduler().select(info, ScoreLedger()) == info
+    assert MinerScheduler(budget=20).select(info, ScoreLedger()) == info
+
+
+def test_every_miner_is_queried_within_rotation_rounds():
+    info = modules(300)
+    scheduler = MinerScheduler(budget=70, rotation_rounds=5, seed=0)
+    history = simulate(scheduler, info, 30, {uid: 0.05 for uid in info})
+
+    assert all(len(picked) == 70 for picked in history)
+    last = {}
+    for round_id, picked in enumerate(history):
+        for uid in picked:
+            assert round_id - last.get(uid, -1) <= 5
+            last[uid] = round_id
+    assert set(last) == set(info)
+
+
+def test_budget_is_raised_to_the_rotation_floor():
+    scheduler = MinerScheduler(budget=10, rotation_rounds=5)
+    assert len(scheduler.select(modules(100), ScoreLedger())) == 20
+
+
+def test_new_uids_come_first():
+    info = modules(20)
+    ledger = ScoreLedger()
+    ledger.next_round()
+    ledger.update(list(range(1, 19)), [0.5] * 18)
+    ledger.next_round()
+    picked = MinerScheduler(budget=5, rotation_rounds=10, seed=0).select(info, ledger)
+    assert {19, 20} <= set(picked)
+
+
+def test_noisy_miners_are_queried_more_often():
+    info = modules(100)
+    noise = {uid: 0.3 if uid % 10 == 0 else 0.01 for uid in info}
+    scheduler = MinerScheduler(budget=40, rotation_rounds=5, seed=0)
+    history = simulate(scheduler, info, 40, noise)
+    counts = {uid: sum(uid in picked for picked in history) for uid in info}
+    noisy = np.mean([counts[uid] for uid in info if noise[uid] > 0.1])
+    stable = np.mean([counts[uid] for uid in info if noise[uid] < 0.1])
+    assert noisy > 1.5 * stable
+
+
+def test_ledger_variance_tracks_score_spread():
+    ledger = ScoreLedger(alpha=0.3)
+    ledger.next_round()
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        ledger.update([1, 2], [0.5, 0.5 + rng.normal(0, 0.2)])
+    counts, age, std = ledger.sampling_stats(np.array([1, 2, 7]))
+    assert counts.tolist() == [50, 50, 0]
+    assert age.tolist() == [0, 0, 2]
+    assert std[0] == 0
+    assert 0.05 < std[1] < 0.5
+    assert std[2] == 0
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+from communex.key import generate_keypair
+
+from mosaic_subnet.base import query
+from mosaic_subnet.base.image_codec import ImageEncoding
+from mosaic_subnet.bench import StubScorer
+from mosaic_subnet.bench.fake_chain import FakeCommuneClient
+from mosaic_subnet.bench.stub_miner import StubMiner
+from mosaic_subnet.validator import Validator, ValidatorSettings
+
+
+class SlowScorer(StubScorer):
+    def score_images(self, text_embeds, files, batch_size=None, nsfw=None):
+        time.sleep(0.2)
+        return [1.0] * len(files)
+
+
+def make_validator(tmp_path, monkeypatch, latencies: dict[int, float]) -> Validator:
+    async def call_miner(key, miner_info, input, timeout, pool=None):
+        port = int(miner_info[0][1])
+        await asyncio.sleep(latencies[port])
+        return b"image"
+
+    monkeypatch.setattr(query, "call_miner", call_miner)
+    miners = [StubMiner(uid=uid, port=uid, key=generate_keypair()) for uid in latencies]
+    prompts = tmp_path / "prompts.txt"
+    prompts.write_text("a prompt\n")
+    key = generate_keypair()
+    client = FakeCommuneClient(key.ss58_address, miners)
+    settings = ValidatorSettings(
+        netuid=client.netuid,
+        nsfw_screening=False,
+        prompt_source=str(prompts),
+        prompt_store_path=str(tmp_path / "prompts.bin"),
+        clip_batch_size=1,
+        pipeline_queue_size=1,
+        round_timeout=0.5,
+    )
+    validator = Validator(key=key, settings=settings, c_client=client)
+    validator.model = SlowScorer()
+    return validator
+
+
+def test_round_scores_answers_delayed_by_backpressure(tmp_path, monkeypatch):
+    latencies = {1: 0.05, 2: 0.1, 3: 0.15, 4: 0.2, 5: 5.0}
+    validator = make_validator(tmp_path, monkeypatch, latencies)
+    offered = []
+    validator.weight_submitter.offer = offered.append
+    get_weights = validator.get_weights
+    threads = []
+
+    def record_thread():
+        threads.append(threading.current_thread())
+        return get_weights()
+
+    validator.get_weights = record_thread
+
+    asyncio.run(validator.validate_step())
+
+    # scoring is slower than the round deadline, answers must still count
+    assert validator.ledger.ema[[1, 2, 3, 4]].tolist() == [1.0] * 4
+    assert validator.ledger.ema[5] == 0.0
+    assert validator.ledger.counts[[1, 2, 3, 4, 5]].tolist() == [1] * 5
+    assert len(offered) == 1
+    # the ledger is only read from the thread that updates it
+    assert threads == [threading.main_thread()]
+    assert set(validator.round_timings) == {"query", "score", "vote", "total"}
+
+
+def test_miners_are_asked_for_the_configured_encoding(tmp_path, monkeypatch):
+    validator = make_validator(tmp_path, monkeypatch, {1: 0.0})
+    assert validator.get_validate_input().encoding == ImageEncoding.WEBP
+
+    validator.settings.image_encoding = ImageEncoding.JPEG
+    validator.settings.image_quality = 80
+    input = validator.get_validate_input()
+    assert (input.encoding, input.quality) == (ImageEncoding.JPEG, 80)
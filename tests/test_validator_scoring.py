@@ -0,0 +1,66 @@
+import pytest
+from communex.key import generate_keypair
+
+from mosaic_subnet.base.lazy import Lazy
+from mosaic_subnet.bench import StubScorer
+from mosaic_subnet.bench.fake_chain import FakeCommuneClient
+from mosaic_subnet.validator import Validator, ValidatorSettings
+
+
+class RecordingScorer(StubScorer):
+    def __init__(self) -> None:
+        self.screened_with = []
+
+    def score_images(self, text_embeds, files, batch_size=None, nsfw=None):
+        self.screened_with.append(nsfw)
+        return [1.0] * len(files)
+
+
+def failing_factory():
+    failing_factory.calls += 1
+    raise OSError("model hub unreachable")
+
+
+failing_factory.calls = 0
+
+
+@pytest.fixture
+def validator(tmp_path) -> Validator:
+    key = generate_keypair()
+    client = FakeCommuneClient(key.ss58_address, [])
+    settings = ValidatorSettings(
+        netuid=client.netuid,
+        prompt_source=str(tmp_path / "prompts.txt"),
+        prompt_store_path=str(tmp_path / "prompts.bin"),
+    )
+    return Validator(key=key, settings=settings, c_client=client)
+
+
+def test_scores_unscreened_when_nsfw_checker_fails_to_load(validator):
+    scorer = RecordingScorer()
+    validator.model = scorer
+    validator._nsfw = Lazy(failing_factory, "NSFW checker", retry_interval=300)
+    failing_factory.calls = 0
+
+    assert validator.calculate_scores(None, [b"a", b"b"]) == [1.0, 1.0]
+    assert validator.calculate_scores(None, [b"c"]) == [1.0]
+    assert scorer.screened_with == [None, None]
+    # the failed load is not retried for every chunk
+    assert failing_factory.calls == 1
+
+
+def test_lazy_retries_after_interval():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("first load fails")
+        return "loaded"
+
+    value = Lazy(factory, retry_interval=0)
+    with pytest.raises(OSError):
+        value.get()
+    assert value.get() == "loaded"
+    assert value.get() == "loaded"
+    assert len(attempts) == 2
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from mosaic_subnet.validator.weights import WeightSubmitter, weight_change
+
+
+class Chain:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.votes = []
+
+    def submit(self, weights: dict[int, int]):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("chain unreachable")
+        self.votes.append(weights)
+
+
+def test_weight_change():
+    assert weight_change({1: 10, 2: 10}, {1: 20, 2: 20}) == 0
+    assert weight_change({1: 1}, {2: 1}) == 1
+    assert weight_change({1: 3, 2: 1}, {1: 1, 2: 1}) == pytest.approx(0.25)
+
+
+def test_newest_vector_wins():
+    chain = Chain()
+    submitter = WeightSubmitter(chain.submit, interval=0)
+    submitter.offer({1: 1})
+    submitter.offer({1: 1, 2: 1})
+    submitter.submit_next()
+    assert chain.votes == [{1: 1, 2: 1}]
+
+
+def test_small_changes_are_skipped():
+    chain = Chain()
+    submitter = WeightSubmitter(chain.submit, interval=0, min_change=0.05)
+    submitter.offer({1: 100, 2: 100})
+    submitter.submit_next()
+    submitter.offer({1: 101, 2: 100})
+    submitter.submit_next()
+    submitter.offer({1: 200, 2: 100})
+    submitter.submit_next()
+    assert chain.votes == [{1: 100, 2: 100}, {1: 200, 2: 100}]
+
+
+def test_failures_back_off_and_retry_with_the_newest_vector():
+    chain = Chain(failures=3)
+    submitter = WeightSubmitter(chain.submit, interval=0, retry_delay=10, max_backoff=25)
+    submitter.offer({1: 1})
+    backoffs = []
+    for _ in range(3):
+        submitter.submit_next()
+        backoffs.append(round(submitter._due - time.monotonic()))
+        submitter._due = 0
+    assert backoffs == [10, 20, 25]
+
+    # offered while the chain was down, replaces the failed vector
+    submitter.offer({1: 1, 2: 1})
+    submitter.submit_next()
+    assert chain.votes == [{1: 1, 2: 1}]
+    assert submitter.last_submitted == {1: 1, 2: 1}
+
+
+def test_submits_at_most_every_interval():
+    chain = Chain()
+    submitter = WeightSubmitter(chain.submit, interval=0.2)
+    submitter.start()
+    submitter.offer({1: 1})
+    time.sleep(0.05)
+    submitter.offer({1: 1, 2: 1})
+    submitter.offer({2: 1})
+    time.sleep(0.1)
+    assert chain.votes == [{1: 1}]
+    time.sleep(0.2)
+    assert chain.votes == [{1: 1}, {2: 1}]